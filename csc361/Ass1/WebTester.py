@@ -1,115 +1,789 @@
-
-
-import re
+import argparse
+import asyncio
+import json
 import socket
 import ssl
 import sys
+import time
+from collections import OrderedDict
+from urllib.parse import urldefrag, urljoin, urlsplit
 
-# 1. Program accepts URI from stdin and parses it
+from headers import BodySkipper, HeaderReader
 
-if len(sys.argv) != 2:
-    print('Unexpected number of arguments. Format is: python3 WebTester.py <URI>')
-    exit()
+# Application protocols offered in the TLS handshake, most preferred first
+ALPN_PROTOCOLS = ('h2', 'http/1.1')
 
-uri = sys.argv[1]
+# HTTP/2 client connection preface followed by an empty SETTINGS frame (RFC 9113 section 3.4)
+H2_PREFACE = b'PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n' + bytes([0, 0, 0, 4, 0, 0, 0, 0, 0])
+H2_SETTINGS = 4
+H2_FRAME_HEADER_SIZE = 9
 
-context = ssl.create_default_context()
+# Bytes asked for by each read of a response
+READ_SIZE = 4096
 
-# 2. Connect to the server of the URI
+# Longest response body read through to keep its connection; past this the connection is closed
+DRAIN_LIMIT = 64 * 1024
 
-try:
-    with socket.create_connection((uri, 443)) as sock:
-        with context.wrap_socket(sock, server_hostname=uri) as ssock:
-            print('Connection established')
-            https = True
-            print('version:' + ssock.version())
+# Redirects followed from one URI before giving up
+MAX_REDIRECTS = 10
 
-            if ssock.selected_alpn_protocol() == 'h2':
-                http2 = True
-            else:
-                http2 = False
-            sock.close()
+# Idle keep-alive connections kept across all origins; the least recently used is closed first
+MAX_IDLE = 256
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Default batch mode limits: probes in flight at once, and seconds allowed for each stage
+CONCURRENCY = 100
+CONNECT_TIMEOUT = 5
+HANDSHAKE_TIMEOUT = 5
+READ_TIMEOUT = 10
+CLOSE_TIMEOUT = 5
+
+class Probe:
+    # What the connections to one origin, (scheme, host, port), have shown. The TLS version and
+    # ALPN choice are those of the first TLS connection
+    def __init__(self, origin):
+        self.scheme, self.host, self.port = origin
+        self.version = None
+        self.alpn = None
+        self.http2 = False
+        self.connections = 0
+        self.handshakes = 0
+
+class Connection:
+    # An open connection to an origin: a socket, or an asyncio stream reader and writer. buffer
+    # holds what was received past the end of the last response
+    def __init__(self, origin, sock=None, reader=None, writer=None, protocols=None):
+        self.origin = origin
+        self.sock = sock
+        self.reader = reader
+        self.writer = writer
+        self.protocols = protocols
+        self.buffer = b''
+        self.version = None
+        self.resumed = False
+        self.handshakes = 0
+        self.requests = 0
+
+class Pool:
+    # Idle keep-alive connections by origin. They are also kept in the order they went idle, so
+    # once there are more than max_idle the least recently used can be closed
+    def __init__(self, max_idle=MAX_IDLE):
+        self.max_idle = max_idle
+        self.idle = {}
+        self.order = OrderedDict()
+
+    def take(self, origin):
+        connections = self.idle.get(origin)
+        if not connections:
+            return None
+        connection = connections.pop()
+        del self.order[connection]
+        return connection
 
-except Exception as e:
-    print(e)
-    https = False
-    http2 = False
+    def put(self, connection):
+        # Returns the connections that no longer fit, for the caller to close
+        self.idle.setdefault(connection.origin, []).append(connection)
+        self.order[connection] = None
+        evicted = []
+        while len(self.order) > self.max_idle:
+            oldest, _ = self.order.popitem(last=False)
+            self.idle[oldest.origin].remove(oldest)
+            evicted.append(oldest)
+        return evicted
+
+    def clear(self):
+        # Remove and return every idle connection
+        connections = list(self.order)
+        self.idle.clear()
+        self.order.clear()
+        return connections
+
+class Redirects:
+    # The URLs of a redirect chain. Each Location is resolved against the URL that returned it,
+    # so relative, scheme-relative and absolute locations all work, and the scheme may change
+    # on the way. A chain that comes back to a URL it already fetched, or that goes on for more
+    # than max_hops redirects, is an error
+    def __init__(self, url, max_hops=MAX_REDIRECTS):
+        self.urls = [url]
+        self.seen = {url}
+        self.max_hops = max_hops
+
+    def next(self, response):
+        # The URL to fetch after this response, or None if it ends the chain
+        if not response.is_redirect():
+            return None
+        url = urldefrag(urljoin(self.urls[-1], response.location))[0]
+        if urlsplit(url).scheme not in DEFAULT_PORTS:
+            raise ValueError(f'Redirect to unsupported URI {url}')
+        if url in self.seen:
+            raise ValueError(f'Redirect loop back to {url}')
+        if len(self.urls) > self.max_hops:
+            raise ValueError(f'More than {self.max_hops} redirects')
+        self.urls.append(url)
+        self.seen.add(url)
+        return url
+
+def normalize_uri(uri):
+    # An absolute URL for a URI given with or without a scheme and path; https is assumed
+    if '://' not in uri:
+        uri = 'https://' + uri
+    parts = urlsplit(uri)
+    if parts.scheme not in DEFAULT_PORTS or not parts.hostname:
+        raise ValueError(f'Unsupported URI {uri}')
+    return urldefrag(parts._replace(path=parts.path or '/').geturl())[0]
+
+def plain_url(url):
+    # The same URL over cleartext HTTP
+    parts = urlsplit(url)
+    return parts._replace(scheme='http').geturl()
+
+def url_origin(url):
+    parts = urlsplit(url)
+    return parts.scheme, parts.hostname, parts.port or DEFAULT_PORTS[parts.scheme]
 
 # 3. Send an HTTP request
 
-def get_request(uri):
-    request = 'GET / HTTP/1.1\r\nHost: ' + uri + '\r\n\r\n'
+def request_bytes(url):
+    parts = urlsplit(url)
+    target = parts.path or '/'
+    if parts.query:
+        target += '?' + parts.query
+    host = parts.netloc.rpartition('@')[2]
+    return ('GET ' + target + ' HTTP/1.1\r\nHost: ' + host + '\r\n\r\n').encode()
+
+def h2_confirmed(frame):
+    # Whether the first frame from a server that picked h2 is its SETTINGS frame
+    return len(frame) == H2_FRAME_HEADER_SIZE and frame[3] == H2_SETTINGS
 
+def recv_frame_header(sock):
+    # The header of the server's first HTTP/2 frame, which may arrive over several reads; shorter
+    # if the server closes the connection first
+    header = b''
+    while len(header) < H2_FRAME_HEADER_SIZE:
+        data = sock.recv(H2_FRAME_HEADER_SIZE - len(header))
+        if not data:
+            break
+        header += data
+    return header
+
+def body_skipper(response):
+    # A BodySkipper for a response whose connection can be reused once its body is read, or None
+    if not response.keep_alive():
+        return None
     try:
-        with socket.create_connection((uri, 443)) as sock:
-            with context.wrap_socket(sock, server_hostname=uri) as ssock:
-                ssock.send(request.encode())
-                response = ssock.recv(10000).decode('utf-8', 'ignore')
+        skipper = BodySkipper(response)
+    except ValueError:
+        return None
+    if skipper.length is None or skipper.length > DRAIN_LIMIT:
+        return None
+    return skipper
+
+class Connector:
+    # Blocking connections for one run. Host names are resolved once and the addresses kept. The
+    # last TLS session of every origin is kept too, so a new connection resumes it with an
+    # abbreviated handshake; a session can only be resumed by the context that created it, so
+    # there is one context and one session cache per ALPN offer. Connections left open after a
+    # response wait in a pool for the next request to the same origin
+    def __init__(self, max_idle=MAX_IDLE):
+        self.contexts = {}
+        self.sessions = {}
+        self.addresses = {}
+        self.probes = {}
+        self.pool = Pool(max_idle)
+
+    def context(self, protocols):
+        if protocols not in self.contexts:
+            context = ssl.create_default_context()
+            context.set_alpn_protocols(list(protocols))
+            self.contexts[protocols] = context
+        return self.contexts[protocols]
+
+    def probe(self, origin):
+        if origin not in self.probes:
+            self.probes[origin] = Probe(origin)
+        return self.probes[origin]
+
+    def protocols(self, origin):
+        # The first connection to an origin offers h2 and http/1.1. Once the server has picked
+        # h2, later connections offer only http/1.1 so that they can carry the requests
+        return ('http/1.1',) if self.probe(origin).alpn == 'h2' else ALPN_PROTOCOLS
+
+    def resolve(self, host):
+        # The host's addresses, looked up once whatever the scheme and port
+        if host not in self.addresses:
+            self.addresses[host] = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        return self.addresses[host]
+
+    def open_socket(self, host, port):
+        # Connect to the first of the host's addresses that accepts
+        error = None
+        for family, kind, protocol, _, address in self.resolve(host):
+            sock = socket.socket(family, kind, protocol)
+            try:
+                sock.connect((address[0], port) + address[2:])
+                return sock
+            except OSError as e:
                 sock.close()
-	
-    except Exception as e:
-        exit(e)
+                error = e
+        raise error
+
+    def connect(self, origin):
+        # A new connection to origin. A server that picks h2 cannot be sent an HTTP/1.1 request
+        # on that connection, so its SETTINGS frame confirms HTTP/2, it is closed, and the
+        # request goes on a second connection that offers only http/1.1
+        scheme, host, port = origin
+        probe = self.probe(origin)
+        probe.connections += 1
+        sock = self.open_socket(host, port)
+        if scheme == 'http':
+            return Connection(origin, sock=sock)
+
+        protocols = self.protocols(origin)
+        try:
+            ssock = self.context(protocols).wrap_socket(sock, server_hostname=host,
+                                                        session=self.sessions.get((origin, protocols)))
+        except BaseException:
+            sock.close()
+            raise
+        probe.handshakes += 1
+        if probe.version is None:
+            probe.version = ssock.version()
+            probe.alpn = ssock.selected_alpn_protocol()
+        if ssock.selected_alpn_protocol() == 'h2':
+            with ssock:
+                ssock.sendall(H2_PREFACE)
+                probe.http2 = h2_confirmed(recv_frame_header(ssock))
+                self.sessions[(origin, protocols)] = ssock.session
+            connection = self.connect(origin)
+            connection.handshakes += 1
+            return connection
 
-    return response
+        connection = Connection(origin, sock=ssock, protocols=protocols)
+        connection.version = ssock.version()
+        connection.resumed = ssock.session_reused
+        connection.handshakes = 1
+        return connection
 
-response = get_request(uri)
+    def read_response(self, connection):
+        # Read up to the end of the response headers
+        reader = HeaderReader()
+        data = connection.buffer
+        while reader.feed(data) is None:
+            data = connection.sock.recv(READ_SIZE)
+            if not data:
+                raise ValueError('Connection closed before the end of the response headers')
+        connection.buffer = reader.rest
+        return reader.response
 
-# Redirect handling
+    def fetch(self, url):
+        # GET url on an idle connection to its origin if there is one, or else a new one, and read
+        # the response headers. Returns the origin's Probe, the response and the connection,
+        # which the caller passes to release or close
+        origin = url_origin(url)
+        connection = self.pool.take(origin)
+        if connection is None:
+            connection = self.connect(origin)
+        connection.requests += 1
+        try:
+            connection.sock.sendall(request_bytes(url))
+            response = self.read_response(connection)
+        except (OSError, ValueError):
+            self.close(connection)
+            if connection.requests > 1:
+                # The server closed the idle connection; a GET can be sent again on a new one
+                return self.fetch(url)
+            raise
+        if connection.protocols is not None:
+            # Read after the response, since TLS 1.3 session tickets arrive after the handshake
+            self.sessions[(origin, connection.protocols)] = connection.sock.session
+        return self.probes[origin], response, connection
 
-if re.search('HTTP/1.\d 30\d', response):
-    print('Redirected')
+    def skip_body(self, connection, response):
+        # Read past the response body so the connection can carry the next response. False if it
+        # cannot: the server closes it, or the body has no length or is too long to be worth reading
+        skipper = body_skipper(response)
+        if skipper is None:
+            return False
+        try:
+            rest = skipper.feed(connection.buffer)
+            while rest is None and skipper.received <= DRAIN_LIMIT:
+                data = connection.sock.recv(READ_SIZE)
+                if not data:
+                    return False
+                rest = skipper.feed(data)
+        except (OSError, ValueError):
+            return False
+        if rest is None:
+            return False
+        connection.buffer = rest
+        return True
 
-    redirect = re.search('Location: https?://(.*?)/', response, re.IGNORECASE)
+    def release(self, connection, response):
+        # Put the connection in the pool once past the response body, or close it
+        if self.skip_body(connection, response):
+            for evicted in self.pool.put(connection):
+                self.close(evicted)
+        else:
+            self.close(connection)
+
+    def fetch_paths(self, urls, pipeline=True):
+        # GET several URLs of one origin on as few connections as the server allows, returning
+        # (response, pipelined) for each in order. An idle connection is already known to stay
+        # open, so every request is written on it back to back and the responses read in order
+        # (HTTP/1.1 pipelining). On a new connection the first request goes alone, and the rest
+        # are pipelined once its response shows that the connection stays open. Whatever is
+        # unanswered when the server closes a connection is sent again on another one
+        results = []
+        while len(results) < len(urls):
+            rest = urls[len(results):]
+            connection = self.pool.take(url_origin(rest[0])) if pipeline else None
+            if connection is None:
+                _, response, connection = self.fetch(rest[0])
+                results.append((response, False))
+                rest = rest[1:]
+                if not rest:
+                    self.release(connection, response)
+                    continue
+                if not self.skip_body(connection, response):
+                    self.close(connection)
+                    continue
+                if not pipeline:
+                    for evicted in self.pool.put(connection):
+                        self.close(evicted)
+                    continue
+            self.pipeline(connection, rest, results)
+        return results
+
+    def pipeline(self, connection, urls, results):
+        # Write every request, then read the responses in order into results until one leaves
+        # the connection unusable
+        try:
+            connection.sock.sendall(b''.join(request_bytes(url) for url in urls))
+            for index, url in enumerate(urls):
+                connection.requests += 1
+                response = self.read_response(connection)
+                results.append((response, True))
+                if index < len(urls) - 1 and not self.skip_body(connection, response):
+                    break
+            else:
+                self.release(connection, response)
+                return
+        except (OSError, ValueError):
+            pass
+        self.close(connection)
+
+    def close(self, connection):
+        connection.sock.close()
+
+    def close_all(self):
+        for connection in self.pool.clear():
+            self.close(connection)
+
+class Timeouts:
+    def __init__(self, connect=CONNECT_TIMEOUT, handshake=HANDSHAKE_TIMEOUT, read=READ_TIMEOUT):
+        self.connect = connect
+        self.handshake = handshake
+        self.read = read
+
+class StageError(Exception):
+    # A batch probe that failed, with the stage it failed in
+    def __init__(self, stage, error):
+        super().__init__(f'{stage}: {error or type(error).__name__}')
+        self.stage = stage
+        self.error = error
+
+async def stage(name, awaitable, timeout):
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        raise StageError(name, 'timed out') from None
+    except (OSError, ssl.SSLError, EOFError, ValueError) as e:
+        raise StageError(name, e) from None
 
-    if redirect is not None:
-        uri = redirect[1]
+class AsyncConnector(Connector):
+    # The asyncio counterpart of Connector, shared by every probe of a batch. A host name being
+    # resolved is kept as the task resolving it, so probes that need it at the same time wait
+    # for one lookup. asyncio streams cannot resume a TLS session, so every handshake is a full one
+    def __init__(self, timeouts=None, max_idle=MAX_IDLE):
+        super().__init__(max_idle)
+        self.timeouts = timeouts or Timeouts()
 
-        print('New URI: ' + uri)
+    async def resolve(self, host):
+        if host not in self.addresses:
+            loop = asyncio.get_running_loop()
+            lookup = asyncio.ensure_future(loop.getaddrinfo(host, None, type=socket.SOCK_STREAM))
+            lookup.add_done_callback(lambda lookup: self.lookup_done(host, lookup))
+            self.addresses[host] = lookup
+        # Shielded, so a probe that times out does not cancel the lookup for the others
+        return await asyncio.shield(self.addresses[host])
 
+    def lookup_done(self, host, lookup):
+        # Only successful lookups are kept, so a failed one is tried again by the next probe that
+        # needs the host rather than failing every probe left in the batch
+        if (lookup.cancelled() or lookup.exception() is not None) and self.addresses.get(host) is lookup:
+            del self.addresses[host]
 
-        if https == True:
+    async def open_stream(self, host, port):
+        error = None
+        for family, _, _, _, address in await self.resolve(host):
             try:
-                with socket.create_connection((uri, 443)) as sock:
-                    with context.wrap_socket(sock, server_hostname=uri) as ssock:
-                        print('Connection established')
-                        https = True
-                        print('version:' + ssock.version())
-
-                        if ssock.selected_alpn_protocol() == 'h2':
-                            http2 = True
-                        else:
-                            http2 = False
-                        sock.close()
-
-            except Exception as e:
-                print(e)
-                https = False
-                http2 = False
-
-        if https == False:
+                return await asyncio.open_connection(address[0], port, family=family)
+            except OSError as e:
+                error = e
+        raise error
+
+    async def connect(self, origin):
+        # TCP connect and TLS handshake are separate stages, each with its own timeout
+        scheme, host, port = origin
+        probe = self.probe(origin)
+        probe.connections += 1
+        reader, writer = await stage('connect', self.open_stream(host, port), self.timeouts.connect)
+        if scheme == 'http':
+            return Connection(origin, reader=reader, writer=writer)
+
+        protocols = self.protocols(origin)
+        try:
+            await stage('handshake', writer.start_tls(self.context(protocols), server_hostname=host),
+                        self.timeouts.handshake)
+        except BaseException:
+            writer.close()
+            raise
+        ssock = writer.get_extra_info('ssl_object')
+        probe.handshakes += 1
+        if probe.version is None:
+            probe.version = ssock.version()
+            probe.alpn = ssock.selected_alpn_protocol()
+        if ssock.selected_alpn_protocol() == 'h2':
             try:
-                with socket.create_connection((uri, 80)) as sock:
-                    with context.wrap_socket(sock, server_hostname=uri) as ssock:
-                        print('Connection established')
-                        https = True
-                        print('version:' + ssock.version())
-                        sock.close()
-            except Exception as e:
-                print(e)
-                http = False
+                writer.write(H2_PREFACE)
+                probe.http2 = h2_confirmed(await stage('read', read_frame_header(reader), self.timeouts.read))
+            finally:
+                await close_writer(writer)
+            connection = await self.connect(origin)
+            connection.handshakes += 1
+            return connection
+
+        connection = Connection(origin, reader=reader, writer=writer, protocols=protocols)
+        connection.version = ssock.version()
+        connection.handshakes = 1
+        return connection
+
+    async def read_response(self, connection):
+        reader = HeaderReader()
+        data = connection.buffer
+        while reader.feed(data) is None:
+            data = await connection.reader.read(READ_SIZE)
+            if not data:
+                raise ValueError('Connection closed before the end of the response headers')
+        connection.buffer = reader.rest
+        return reader.response
+
+    async def fetch(self, url):
+        origin = url_origin(url)
+        connection = self.pool.take(origin)
+        if connection is None:
+            connection = await self.connect(origin)
+        connection.requests += 1
+        try:
+            connection.writer.write(request_bytes(url))
+            response = await stage('read', self.read_response(connection), self.timeouts.read)
+        except BaseException as e:
+            await self.close(connection)
+            if isinstance(e, StageError) and e.stage == 'read' and connection.requests > 1:
+                return await self.fetch(url)
+            raise
+        return self.probes[origin], response, connection
+
+    async def skip_body(self, connection, response):
+        skipper = body_skipper(response)
+        if skipper is None:
+            return False
+        try:
+            rest = skipper.feed(connection.buffer)
+            while rest is None and skipper.received <= DRAIN_LIMIT:
+                data = await asyncio.wait_for(connection.reader.read(READ_SIZE), self.timeouts.read)
+                if not data:
+                    return False
+                rest = skipper.feed(data)
+        except (OSError, ValueError, asyncio.TimeoutError):
+            return False
+        if rest is None:
+            return False
+        connection.buffer = rest
+        return True
+
+    async def release(self, connection, response):
+        if await self.skip_body(connection, response):
+            for evicted in self.pool.put(connection):
+                await self.close(evicted)
+        else:
+            await self.close(connection)
+
+    async def fetch_paths(self, urls, pipeline=True):
+        results = []
+        while len(results) < len(urls):
+            rest = urls[len(results):]
+            connection = self.pool.take(url_origin(rest[0])) if pipeline else None
+            if connection is None:
+                _, response, connection = await self.fetch(rest[0])
+                results.append((response, False))
+                rest = rest[1:]
+                if not rest:
+                    await self.release(connection, response)
+                    continue
+                if not await self.skip_body(connection, response):
+                    await self.close(connection)
+                    continue
+                if not pipeline:
+                    for evicted in self.pool.put(connection):
+                        await self.close(evicted)
+                    continue
+            await self.pipeline(connection, rest, results)
+        return results
+
+    async def pipeline(self, connection, urls, results):
+        try:
+            connection.writer.write(b''.join(request_bytes(url) for url in urls))
+            for index, url in enumerate(urls):
+                connection.requests += 1
+                response = await stage('read', self.read_response(connection), self.timeouts.read)
+                results.append((response, True))
+                if index < len(urls) - 1 and not await self.skip_body(connection, response):
+                    break
+            else:
+                await self.release(connection, response)
+                return
+        except StageError:
+            pass
+        await self.close(connection)
+
+    async def close(self, connection):
+        await close_writer(connection.writer)
+
+    async def close_all(self):
+        for connection in self.pool.clear():
+            await self.close(connection)
+
+async def read_frame_header(reader):
+    # As recv_frame_header, for an asyncio stream
+    try:
+        return await reader.readexactly(H2_FRAME_HEADER_SIZE)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+async def close_writer(writer, timeout=CLOSE_TIMEOUT):
+    # Close a stream, waiting at most timeout seconds for the peer (a TLS close_notify, for one)
+    # before dropping the connection
+    writer.close()
+    try:
+        await asyncio.wait_for(writer.wait_closed(), timeout)
+    except asyncio.TimeoutError:
+        writer.transport.abort()
+    except (OSError, ssl.SSLError):
+        pass
+
+def print_connection(connection):
+    if connection.requests > 1:
+        print('Connection reused')
+        return
+    print('Connection established')
+    if connection.version is not None:
+        print('version:' + connection.version)
+    if connection.resumed:
+        print('TLS session resumed')
+
+def response_fields(url, response):
+    return {'url': url, 'status': response.status, 'location': response.location,
+            'cookies': [cookie.as_dict() for cookie in response.cookies]}
+
+async def check_uri(uri, connector, max_redirects=MAX_REDIRECTS, paths=(), pipeline=True):
+    # One batch result: every response of the URI's redirect chain, what the connections to the
+    # origin it ends at showed, and the responses to paths on that origin. A URI given without a
+    # scheme whose host does not answer over TLS is tried again over plain HTTP. Connections and
+    # handshakes count only those the redirect chain opened
+    result = {'uri': uri}
+    chain = result['chain'] = []
+    connections = handshakes = 0
+    start = time.perf_counter()
+    try:
+        url = normalize_uri(uri)
+        try:
+            fetched = await connector.fetch(url)
+        except StageError as e:
+            if '://' in uri or e.stage not in ('connect', 'handshake'):
+                raise
+            result['https_error'] = str(e.error)
+            url = plain_url(url)
+            fetched = await connector.fetch(url)
+        redirects = Redirects(url, max_redirects)
+        while True:
+            probe, response, connection = fetched
+            if connection.requests == 1:
+                connections += 1
+                handshakes += connection.handshakes
+            chain.append(response_fields(url, response))
+            await connector.release(connection, response)
+            try:
+                url = redirects.next(response)
+            except ValueError as e:
+                raise StageError('redirect', e) from None
+            if url is None:
+                break
+            fetched = await connector.fetch(url)
+        result.update(url=chain[-1]['url'], status=chain[-1]['status'], host=probe.host,
+                      version=probe.version, alpn=probe.alpn, http2=probe.http2)
+        if paths:
+            urls = [urljoin(result['url'], path) for path in paths]
+            results = await connector.fetch_paths(urls, pipeline)
+            result['paths'] = [dict(response_fields(url, response), pipelined=pipelined)
+                               for url, (response, pipelined) in zip(urls, results)]
+    except StageError as e:
+        result.update(error=str(e.error), stage=e.stage)
+    except (OSError, ValueError, UnicodeError) as e:
+        result.update(error=str(e), stage='connect')
+    result.update(connections=connections, handshakes=handshakes, ms=round((time.perf_counter() - start) * 1000, 1))
+    return result
+
+async def run_batch(lines, out, concurrency=CONCURRENCY, timeouts=None, max_redirects=MAX_REDIRECTS, paths=(),
+                    pipeline=True):
+    # Probe every URI read from lines with at most concurrency probes in flight, writing one JSON
+    # line per URI as soon as its probe finishes, so results come in completion order. URIs are
+    # read on a thread into a bounded queue, so a slow stdin never stalls the probes and a long
+    # input is never held in memory. All probes share one AsyncConnector, so a host is resolved
+    # once per batch and an origin's idle connections serve the redirects and URIs that follow
+    connector = AsyncConnector(timeouts)
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(concurrency * 2)
+
+    async def produce():
+        while True:
+            line = await loop.run_in_executor(None, lines.readline)
+            if not line:
+                break
+            uri = line.strip()
+            if uri and not uri.startswith('#'):
+                await queue.put(uri)
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            uri = await queue.get()
+            if uri is None:
+                return
+            result = await check_uri(uri, connector, max_redirects, paths, pipeline)
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+
+    try:
+        await asyncio.gather(produce(), *(work() for _ in range(concurrency)))
+    finally:
+        await connector.close_all()
+
+def main():
+    # 1. Program accepts URI from stdin and parses it
+
+    parser = argparse.ArgumentParser(usage='python3 WebTester.py <URI> | --batch FILE')
+    parser.add_argument('uri', nargs='?', help='The URI to test')
+    parser.add_argument('--batch', metavar='FILE',
+                        help="Test every URI in FILE, one per line ('-' for standard input), and write "
+                             "one JSON line per URI")
+    parser.add_argument('--max-redirects', type=int, default=MAX_REDIRECTS,
+                        help=f'Redirects followed from one URI (default: {MAX_REDIRECTS})')
+    parser.add_argument('--path', action='append', default=[],
+                        help='Also request this path on the origin the redirects end at; may be repeated')
+    parser.add_argument('--no-pipeline', action='store_true',
+                        help='Wait for each response to a --path before sending the next request')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help=f'Batch probes in flight at once (default: {CONCURRENCY})')
+    parser.add_argument('--connect-timeout', type=float, default=CONNECT_TIMEOUT,
+                        help=f'Seconds allowed for each TCP connect in batch mode (default: {CONNECT_TIMEOUT})')
+    parser.add_argument('--handshake-timeout', type=float, default=HANDSHAKE_TIMEOUT,
+                        help=f'Seconds allowed for each TLS handshake in batch mode (default: {HANDSHAKE_TIMEOUT})')
+    parser.add_argument('--read-timeout', type=float, default=READ_TIMEOUT,
+                        help=f'Seconds allowed for each response in batch mode (default: {READ_TIMEOUT})')
+    args = parser.parse_args()
+    if (args.uri is None) == (args.batch is None):
+        parser.error('Give either one URI or --batch FILE')
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+    if args.max_redirects < 0:
+        parser.error('--max-redirects cannot be negative')
+
+    if args.batch is not None:
+        timeouts = Timeouts(args.connect_timeout, args.handshake_timeout, args.read_timeout)
+        if args.batch == '-':
+            asyncio.run(run_batch(sys.stdin, sys.stdout, args.concurrency, timeouts, args.max_redirects, args.path,
+                                  not args.no_pipeline))
+        else:
+            with open(args.batch) as lines:
+                asyncio.run(run_batch(lines, sys.stdout, args.concurrency, timeouts, args.max_redirects, args.path,
+                                      not args.no_pipeline))
+        return
+
+    connector = Connector()
+
+    # 2. Connect to the server of the URI and send the request, then follow the redirects
+
+    try:
+        url = normalize_uri(args.uri)
+        try:
+            probe, response, connection = connector.fetch(url)
+        except OSError as e:
+            if '://' in args.uri:
+                raise
+            # A host given without a scheme that does not answer over TLS is tried over plain HTTP
+            print(e)
+            url = plain_url(url)
+            print('New URI: ' + url)
+            probe, response, connection = connector.fetch(url)
+        redirects = Redirects(url, args.max_redirects)
+        while True:
+            print_connection(connection)
+
+            # Redirect handling
+
+            next_url = redirects.next(response)
+            if next_url is None:
+                break
+            connector.release(connection, response)
+            print('Redirected')
+            url = next_url
+            print('New URI: ' + url)
+            probe, response, connection = connector.fetch(url)
+    except (OSError, ValueError) as e:
+        exit(e)
+
+    # Cookie time:
 
-        response = get_request(uri)
+    cookies = response.cookies
 
-# Cookie time:
+    # Print results:
 
-cookies = re.findall('Set-Cookie: (.*?)\r\n', response)
+    if probe.http2:
+        print('HTTP/2 is enabled')
+    else:
+        print('HTTP/2 is not enabled')
+    for cookie in cookies:
+        print('Cookie:' + cookie.header)
 
+    # Other paths on the same origin, pipelined on one connection where the server allows it
 
-# Print results:
+    if args.path:
+        connector.release(connection, response)
+        urls = [urljoin(url, path) for path in args.path]
+        try:
+            results = connector.fetch_paths(urls, not args.no_pipeline)
+        except (OSError, ValueError) as e:
+            exit(e)
+        for path_url, (path_response, pipelined) in zip(urls, results):
+            print(f'{path_url}: {path_response.status} {path_response.reason}' + (' (pipelined)' if pipelined else ''))
+            for cookie in path_response.cookies:
+                print('Cookie:' + cookie.header)
+    else:
+        connector.close(connection)
+    connector.close_all()
 
-if http2:
-    print('HTTP/2 is enabled')
-else:
-    print('HTTP/2 is not enabled')
-for cookie in cookies:
-    print('Cookie:' + cookie)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Incremental HTTP/1.x response header reader and body skipper for WebTester.
+
+Bytes are fed in as they arrive and only the newly received part is searched for the blank line
+that ends the header block, so a block split over many reads is still scanned once. Reading
+stops at the terminator: whatever came after it is the start of the body and is kept aside
+rather than parsed, and a block that grows past the size cap is rejected instead of read
+forever. The block is then parsed in one pass over its lines into the status, the headers, the
+redirect location and every Set-Cookie with its attributes.
+
+A body is never parsed either, only skipped by its framing (Content-Length or chunked transfer
+coding), so that a keep-alive connection can carry the next response. The bytes after it are
+handed back, since they may already belong to that next response.
+
+Header bytes are decoded as ISO-8859-1, which maps every byte to one character, so nothing a
+server sends is lost or rejected.
+"""
+
+# Largest header block accepted, terminator included
+MAX_HEADER_SIZE = 64 * 1024
+
+TERMINATOR = b'\r\n\r\n'
+
+# Longest chunk size or trailer line accepted in a chunked body
+MAX_LINE_SIZE = 4096
+
+class Cookie:
+    # One Set-Cookie header: the name and value of the cookie, its attributes by lower-case name
+    # (True for flags such as Secure), and the header value as sent
+    def __init__(self, header):
+        self.header = header
+        self.attributes = {}
+        pair, *attributes = header.split(';')
+        name, equals, value = pair.partition('=')
+        if equals:
+            self.name = name.strip()
+            self.value = value.strip()
+        else:
+            # A cookie without a name (RFC 6265 section 5.2)
+            self.name = ''
+            self.value = pair.strip()
+        for attribute in attributes:
+            name, equals, value = attribute.partition('=')
+            name = name.strip().lower()
+            if name:
+                self.attributes[name] = value.strip() if equals else True
+
+    def as_dict(self):
+        return {'name': self.name, 'value': self.value, 'attributes': self.attributes}
+
+class Response:
+    def __init__(self):
+        self.version = None
+        self.status = None
+        self.reason = ''
+        # (name, value) pairs in the order they were sent, since names can repeat
+        self.headers = []
+        self.location = None
+        self.cookies = []
+        self.size = 0
+
+    def header(self, name, default=None):
+        # The last value of a header, by case-insensitive name
+        name = name.lower()
+        for header, value in reversed(self.headers):
+            if header.lower() == name:
+                return value
+        return default
+
+    def is_redirect(self):
+        return 300 <= self.status < 400 and self.location is not None
+
+    def keep_alive(self):
+        # Whether the server leaves the connection open after this response
+        connection = self.header('Connection', '').lower()
+        if self.version == 'HTTP/1.0':
+            return 'keep-alive' in connection
+        return 'close' not in connection
+
+def parse_head(head):
+    # Parse a header block, without its terminator, into a Response
+    lines = head.decode('iso-8859-1').split('\r\n')
+    version, _, rest = lines[0].partition(' ')
+    status, _, reason = rest.partition(' ')
+    if not version.startswith('HTTP/') or len(status) != 3 or not status.isdigit():
+        raise ValueError(f'Malformed status line: {lines[0]!r}')
+
+    response = Response()
+    response.version = version
+    response.status = int(status)
+    response.reason = reason
+    response.size = len(head) + len(TERMINATOR)
+    headers = response.headers
+    for line in lines[1:]:
+        if line[:1] in (' ', '\t') and headers:
+            # Obsolete line folding continues the previous header
+            name, value = headers[-1]
+            headers[-1] = (name, value + ' ' + line.strip())
+            continue
+        name, colon, value = line.partition(':')
+        if colon:
+            headers.append((name.strip(), value.strip()))
+
+    for name, value in headers:
+        name = name.lower()
+        if name == 'location':
+            response.location = value
+        elif name == 'set-cookie':
+            response.cookies.append(Cookie(value))
+    return response
+
+class HeaderReader:
+    def __init__(self, max_size=MAX_HEADER_SIZE):
+        self.max_size = max_size
+        self.buffer = bytearray()
+        self.response = None
+        # Bytes received after the header block, i.e. the start of the body
+        self.rest = b''
+
+    def feed(self, data):
+        # Add received bytes. Returns the Response once the header block is complete, else None
+        start = max(len(self.buffer) - len(TERMINATOR) + 1, 0)
+        self.buffer += data
+        end = self.buffer.find(TERMINATOR, start)
+        if end < 0:
+            if len(self.buffer) > self.max_size:
+                raise ValueError(f'Response header block is larger than {self.max_size} bytes')
+            return None
+        if end + len(TERMINATOR) > self.max_size:
+            raise ValueError(f'Response header block is larger than {self.max_size} bytes')
+        self.rest = bytes(self.buffer[end + len(TERMINATOR):])
+        self.response = parse_head(bytes(self.buffer[:end]))
+        return self.response
+
+class BodySkipper:
+    # Skips the body of a response as it is fed. length is the number of body bytes still
+    # expected (of the current chunk and its CRLF, for a chunked body), or None when the body
+    # runs until the server closes the connection
+    def __init__(self, response, method='GET'):
+        self.chunked = False
+        self.trailer = False
+        self.line = bytearray()
+        self.received = 0
+        self.done = False
+        if method == 'HEAD' or response.status < 200 or response.status in (204, 304):
+            self.length = 0
+        elif 'chunked' in response.header('Transfer-Encoding', '').lower():
+            self.chunked = True
+            self.length = 0
+        elif response.header('Content-Length') is not None:
+            self.length = int(response.header('Content-Length'))
+            if self.length < 0:
+                raise ValueError(f'Negative Content-Length {self.length}')
+        else:
+            self.length = None
+
+    def feed(self, data):
+        # Add received bytes. Returns the bytes that follow the body once it is complete, else None
+        self.received += len(data)
+        if self.length is None:
+            return None
+        if not self.chunked:
+            if len(data) < self.length:
+                self.length -= len(data)
+                return None
+            rest = data[self.length:]
+            self.length = 0
+            self.done = True
+            return rest
+
+        offset = 0
+        while True:
+            if self.length:
+                taken = min(self.length, len(data) - offset)
+                self.length -= taken
+                offset += taken
+                if self.length:
+                    return None
+            # Chunk size and trailer lines may be split across reads
+            newline = data.find(b'\n', offset)
+            if newline < 0:
+                self.line += data[offset:]
+                if len(self.line) > MAX_LINE_SIZE:
+                    raise ValueError('Chunked body line is too long')
+                return None
+            self.line += data[offset:newline + 1]
+            offset = newline + 1
+            line = bytes(self.line).strip()
+            self.line.clear()
+            if self.trailer:
+                if not line:
+                    self.done = True
+                    return data[offset:]
+                continue
+            size = int(line.split(b';')[0], 16)
+            if size:
+                # The chunk data is followed by a CRLF
+                self.length = size + 2
+            else:
+                self.trailer = True
@@ -0,0 +1,138 @@
+"""
+Benchmark for p2.
+
+Times read_capture_file, parse_capture_data and print_results separately on a capture, by
+default a deterministic synthetic one written with pcaptools.synthetic, and reports packets/sec
+for each stage, the peak RSS of the process and, with --allocations, the peak of the memory
+traced by tracemalloc during each stage (a separate, slower pass). That peak includes what the
+earlier stages still hold, such as the capture bytes. Results are written as JSON so runs
+of different versions can be compared.
+
+Usage:
+
+    python3 ./bench_p2.py [capture file] [--flows N] [--packets-per-flow N] [--size 100MB]
+                          [--repeat N] [--allocations] [--output results.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import p2  # also puts the shared pcaptools package on sys.path
+from pcaptools.synthetic import generate_capture, parse_size
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+def run_stages(file_path):
+    # One pass over the three stages, returning their outputs and wall times
+    timings = {}
+    start = time.perf_counter()
+    data = p2.read_capture_file(file_path)
+    timings['read_capture_file'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    flows = p2.parse_capture_data(data)
+    timings['parse_capture_data'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    p2.print_results(flows, out=io.StringIO())
+    timings['print_results'] = time.perf_counter() - start
+    return flows, timings
+
+def measure_allocations(file_path):
+    # Peak traced bytes during each stage, in a pass of its own since tracing is slow
+    peaks = {}
+    tracemalloc.start()
+    data = p2.read_capture_file(file_path)
+    peaks['read_capture_file'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    flows = p2.parse_capture_data(data)
+    peaks['parse_capture_data'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    p2.print_results(flows, out=io.StringIO())
+    peaks['print_results'] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peaks
+
+def benchmark(file_path, repeat, allocations):
+    best = {}
+    for _ in range(repeat):
+        flows, timings = run_stages(file_path)
+        for stage, elapsed in timings.items():
+            best[stage] = min(best.get(stage, elapsed), elapsed)
+    packets = sum(flows.packets_sent) + sum(flows.packets_received)
+
+    stages = {stage: {'seconds': elapsed, 'packets_per_second': packets / elapsed if elapsed else None}
+              for stage, elapsed in best.items()}
+    if allocations:
+        for stage, peak in measure_allocations(file_path).items():
+            stages[stage]['peak_traced_bytes'] = peak
+    return {
+        'capture': os.path.abspath(file_path),
+        'capture_bytes': os.path.getsize(file_path),
+        'packets': packets,
+        'connections': len(flows),
+        'repeat': repeat,
+        'stages': stages,
+        'peak_rss_bytes': peak_rss(),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', nargs='?', help='Capture to benchmark; a synthetic one is generated if omitted')
+    parser.add_argument('--flows', type=int, default=1000, help='Flows in the synthetic capture')
+    parser.add_argument('--packets-per-flow', type=int, default=20, help='Mean packets per synthetic flow')
+    parser.add_argument('--size', type=parse_size, help='Size of the synthetic capture, e.g. 1MB or 10GB (overrides --flows)')
+    parser.add_argument('--seed', type=int, default=361, help='Seed of the synthetic capture')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed passes, the best is reported')
+    parser.add_argument('--allocations', action='store_true', help='Also trace allocations in an extra pass')
+    parser.add_argument('--output', help='Write the results to this JSON file as well as stdout')
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error('--repeat must be at least 1')
+
+    generated = None
+    file_path = args.filename
+    if file_path is None:
+        handle, generated = tempfile.mkstemp(suffix='.cap')
+        os.close(handle)
+        generate_capture(generated, args.flows, args.packets_per_flow, size=args.size, seed=args.seed)
+        file_path = generated
+
+    try:
+        results = benchmark(file_path, args.repeat, args.allocations)
+    finally:
+        if generated is not None:
+            os.remove(generated)
+
+    if generated is not None:
+        results['capture'] = None
+        results['synthetic'] = {'flows': args.flows, 'packets_per_flow': args.packets_per_flow,
+                                'size': args.size, 'seed': args.seed}
+    results['revision'] = git_revision()
+    results['python'] = platform.python_version()
+    results['created'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+
+    report = json.dumps(results, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(report + '\n')
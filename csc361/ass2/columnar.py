@@ -0,0 +1,283 @@
+"""
+Columnar engine for p2.
+
+Instead of decoding one packet at a time in Python, the capture is first indexed by record
+offset, then the fixed header fields of every packet are gathered into a NumPy structured
+array (timestamps, IPv4 addresses as uint32, ports, flags and lengths) and the per-connection
+counters are computed with a vectorized group-by. The result is the same FlowTable that
+parse_capture_data builds, so print_results output is identical.
+
+RTT matching depends on the order of the segments inside each flow, so the gathered sequence
+and acknowledgement numbers are fed through the same RttTracker as the Python engine, one packet
+at a time; only the per-flow RTT statistics are reduced with NumPy again.
+
+Record headers are read in the byte order and timestamp resolution the capture declares, and
+the IPv4 header of every packet is located for the capture's link type (Ethernet with or without
+a VLAN tag, Linux cooked or raw IP); packets that do not carry IPv4 are dropped before the
+gather, as pcaptools.reader does. TCP fields are gathered from where each packet's IHL puts its
+TCP header, and payload lengths honour the TCP data offset.
+"""
+
+import numpy as np
+
+from p2 import FlowTable, index_record_offsets, normalize_connection_key
+from pcaptools.decode import decode_window_scale
+from pcaptools.reader import (ETHERTYPE_IPV4, ETHERTYPE_VLAN, LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL,
+                              LINKTYPE_LINUX_SLL2, CaptureFormat)
+from rtt import RttTracker
+
+PACKET_DTYPE = np.dtype([
+    ('timestamp', np.float64),
+    ('microseconds', np.uint64),
+    ('source_address', np.uint32),
+    ('destination_address', np.uint32),
+    ('source_port', np.uint16),
+    ('destination_port', np.uint16),
+    ('flags', np.uint8),
+    ('length', np.uint32),
+    ('sequence', np.uint32),
+    ('acknowledgement', np.uint32),
+    ('window', np.uint16),
+    ('payload_length', np.int64),
+    ('segment_length', np.int64),
+])
+
+# Field positions measured from the start of a pcap record (16 byte record header, then the frame)
+TIMESTAMP_OFFSET = 0
+TIMESTAMPUS_OFFSET = 4
+LENGTH_OFFSET = 8
+FRAME_OFFSET = 16
+
+# Field positions measured from the start of the IPv4 header
+TOTAL_LENGTH_OFFSET = 2
+SOURCE_ADDRESS_OFFSET = 12
+DESTINATION_ADDRESS_OFFSET = 16
+
+# Field positions measured from the start of the TCP header
+SOURCE_PORT_OFFSET = 0
+DESTINATION_PORT_OFFSET = 2
+SEQUENCE_OFFSET = 4
+ACKNOWLEDGEMENT_OFFSET = 8
+DATA_OFFSET_OFFSET = 12
+FLAGS_OFFSET = 13
+WINDOW_OFFSET = 14
+
+def index_records(data):
+    return np.frombuffer(index_record_offsets(data), dtype=np.int64)
+
+def gather_uint(buffer, positions, size, big_endian):
+    # Fancy-index all bytes of the field at once into an (n, size) block and reinterpret it
+    block = buffer[positions[:, np.newaxis] + np.arange(size)]
+    return block.view(('>' if big_endian else '<') + 'u' + str(size)).ravel()
+
+def locate_ipv4(buffer, offsets, capture_format):
+    # Position of the IPv4 header of every record, and which records carry IPv4 at all
+    big_endian = capture_format.byte_order == '>'
+    included = gather_uint(buffer, offsets + LENGTH_OFFSET, 4, big_endian).astype(np.int64)
+    frames = offsets + FRAME_OFFSET
+    # Reads of link layer fields are clamped to the record so a truncated frame cannot index
+    # past the end of the capture; the length checks then reject it
+    last = frames + np.maximum(included, 1) - 1
+
+    def field(position):
+        return gather_uint(buffer, np.minimum(frames + position, last - 1), 2, True)
+
+    link_type = capture_format.link_type
+    if link_type == LINKTYPE_ETHERNET:
+        ethertype = field(12)
+        tagged = (ethertype == ETHERTYPE_VLAN) & (included >= 18)
+        ethertype = np.where(tagged, field(16), ethertype)
+        header_length = np.where(tagged, 18, 14)
+    elif link_type == LINKTYPE_LINUX_SLL:
+        ethertype = field(14)
+        header_length = np.full(len(offsets), 16)
+    elif link_type == LINKTYPE_LINUX_SLL2:
+        ethertype = field(0)
+        header_length = np.full(len(offsets), 20)
+    else:
+        version = buffer[np.minimum(frames, last)] >> 4
+        ethertype = np.where(version == 4, ETHERTYPE_IPV4, 0)
+        header_length = np.zeros(len(offsets), dtype=np.int64)
+    ipv4 = (ethertype == ETHERTYPE_IPV4) & (included >= header_length + 1)
+    return frames + header_length, ipv4
+
+def gather_packets(data, offsets, ip, capture_format):
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    big_endian = capture_format.byte_order == '>'
+
+    packets = np.empty(len(offsets), dtype=PACKET_DTYPE)
+    timestamp = gather_uint(buffer, offsets + TIMESTAMP_OFFSET, 4, big_endian)
+    fraction = gather_uint(buffer, offsets + TIMESTAMPUS_OFFSET, 4, big_endian)
+    if capture_format.nanoseconds:
+        fraction = fraction // 1000
+    packets['timestamp'] = timestamp.astype(np.float64) + fraction.astype(np.float64) / 1000000
+    packets['microseconds'] = timestamp.astype(np.uint64) * 1000000 + fraction
+    packets['length'] = gather_uint(buffer, offsets + LENGTH_OFFSET, 4, big_endian)
+    packets['source_address'] = gather_uint(buffer, ip + SOURCE_ADDRESS_OFFSET, 4, True)
+    packets['destination_address'] = gather_uint(buffer, ip + DESTINATION_ADDRESS_OFFSET, 4, True)
+
+    # The TCP header starts IHL words into the IPv4 header
+    ip_header_length = (buffer[ip] & 0x0F).astype(np.int64) * 4
+    tcp = ip + ip_header_length
+    packets['source_port'] = gather_uint(buffer, tcp + SOURCE_PORT_OFFSET, 2, True)
+    packets['destination_port'] = gather_uint(buffer, tcp + DESTINATION_PORT_OFFSET, 2, True)
+    packets['flags'] = buffer[tcp + FLAGS_OFFSET]
+    packets['sequence'] = gather_uint(buffer, tcp + SEQUENCE_OFFSET, 4, True)
+    packets['acknowledgement'] = gather_uint(buffer, tcp + ACKNOWLEDGEMENT_OFFSET, 4, True)
+    packets['window'] = gather_uint(buffer, tcp + WINDOW_OFFSET, 2, True)
+
+    total_length = gather_uint(buffer, ip + TOTAL_LENGTH_OFFSET, 2, True).astype(np.int64)
+    tcp_header_length = (buffer[tcp + DATA_OFFSET_OFFSET] >> 4).astype(np.int64) * 4
+    packets['payload_length'] = np.maximum(total_length - ip_header_length - tcp_header_length, 0)
+    # Sequence space each segment takes up: its payload, plus one each for SYN and FIN
+    packets['segment_length'] = packets['payload_length'] + ((packets['flags'] >> 1) & 1) + (packets['flags'] & 1)
+    return packets
+
+def endpoints(packets):
+    source = (packets['source_address'].astype(np.uint64) << np.uint64(16)) | packets['source_port']
+    destination = (packets['destination_address'].astype(np.uint64) << np.uint64(16)) | packets['destination_port']
+    return source, destination
+
+def group_connections(packets):
+    # Both directions of a connection share the same (lower endpoint, higher endpoint) key
+    source, destination = endpoints(packets)
+    low = np.minimum(source, destination)
+    high = np.maximum(source, destination)
+
+    # lexsort is stable, so packets keep capture order inside each connection
+    order = np.lexsort((high, low))
+    sorted_low = low[order]
+    sorted_high = high[order]
+    boundary = np.ones(len(order), dtype=bool)
+    boundary[1:] = (sorted_low[1:] != sorted_low[:-1]) | (sorted_high[1:] != sorted_high[:-1])
+    starts = np.flatnonzero(boundary)
+    first = order[starts]
+    last = order[np.append(starts[1:] - 1, len(order) - 1)]
+
+    # Number connections by their first packet, which is the order the Python engine reports them in
+    by_appearance = np.argsort(first, kind='stable')
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[by_appearance] = np.arange(len(first))
+    group = np.empty(len(order), dtype=np.int64)
+    group[order] = rank[np.cumsum(boundary) - 1]
+    return group, first[by_appearance], last[by_appearance]
+
+def count(group, mask, groups, weights=None):
+    if weights is not None:
+        # Accumulate in int64 rather than through float bincount weights so large totals stay exact
+        totals = np.zeros(groups, dtype=np.int64)
+        np.add.at(totals, group[mask], weights[mask])
+        return totals
+    return np.bincount(group[mask], minlength=groups)
+
+def match_rtts(packets, group, sent, groups):
+    # Run every segment through the tracker in capture order, with the flow number as its key
+    source, destination = endpoints(packets)
+    direction = (source > destination).astype(np.uint8)
+    tracker = RttTracker()
+    sample_groups = []
+    samples = []
+    for flow_id, flow_direction, timestamp, seq, ack, length, flags, from_source in zip(
+            group.tolist(), direction.tolist(), packets['microseconds'].tolist(), packets['sequence'].tolist(),
+            packets['acknowledgement'].tolist(), packets['segment_length'].tolist(), packets['flags'].tolist(),
+            sent.tolist()):
+        sample = tracker.segment(flow_id, flow_direction, timestamp, seq, ack, length, flags)
+        # Only ACKs coming back to the source time its segments, as in collect_flows
+        if sample is not None and not from_source:
+            sample_groups.append(flow_id)
+            samples.append(sample)
+
+    return aggregate(np.array(sample_groups, dtype=np.int64), np.array(samples, dtype=np.uint64), groups)
+
+def aggregate(group, values, groups):
+    # Count, sum, minimum and maximum of the values of every connection, like p2's aggregate columns
+    values = values.astype(np.uint64)
+    counts = np.bincount(group, minlength=groups)
+    totals = np.zeros(groups, dtype=np.uint64)
+    np.add.at(totals, group, values)
+    minimums = np.full(groups, np.iinfo(np.uint64).max, dtype=np.uint64)
+    np.minimum.at(minimums, group, values)
+    minimums[counts == 0] = 0
+    maximums = np.zeros(groups, dtype=np.uint64)
+    np.maximum.at(maximums, group, values)
+    return counts, totals, minimums, maximums
+
+def window_scales(data, ip, group, sent, syn, groups):
+    # The first window scale option each end of a connection sent, -1 where it sent none. Only SYN
+    # segments carry one, so only those are decoded, one at a time
+    source_scales = np.full(groups, -1, dtype=np.int8)
+    destination_scales = np.full(groups, -1, dtype=np.int8)
+    view = memoryview(data)
+    for index in np.flatnonzero(syn).tolist():
+        scale = decode_window_scale(view[ip[index]:])
+        if scale is not None:
+            scales = source_scales if sent[index] else destination_scales
+            if scales[group[index]] < 0:
+                scales[group[index]] = scale
+    return source_scales, destination_scales
+
+def parse_capture_columns(data):
+    offsets = index_records(data)
+    if len(offsets) == 0:
+        return FlowTable()
+    capture_format = CaptureFormat(data)
+    ip, ipv4 = locate_ipv4(np.frombuffer(data, dtype=np.uint8), offsets, capture_format)
+    offsets = offsets[ipv4]
+    ip = ip[ipv4]
+    if len(offsets) == 0:
+        return FlowTable()
+    packets = gather_packets(data, offsets, ip, capture_format)
+    group, first, last = group_connections(packets)
+    groups = len(first)
+
+    flags = packets['flags']
+    syn_counts = count(group, (flags & 0x02) != 0, groups)
+    fin_counts = count(group, (flags & 0x01) != 0, groups)
+    rst_counts = count(group, (flags & 0x04) != 0, groups)
+
+    # A packet is sent by the source when it comes from the endpoint of the connection's first packet
+    sent = (packets['source_address'] == packets['source_address'][first][group]) & \
+        (packets['source_port'] == packets['source_port'][first][group])
+    lengths = packets['payload_length']
+    packets_sent = count(group, sent, groups)
+    packets_received = count(group, ~sent, groups)
+    bytes_sent = count(group, sent, groups, lengths)
+    bytes_received = count(group, ~sent, groups, lengths)
+    rtt_samples = match_rtts(packets, group, sent, groups)
+
+    # Windows as in collect_flows: none from resets, SYN windows unscaled, the rest per direction
+    windows = packets['window']
+    handshake = ((flags & 0x04) == 0) & ((flags & 0x02) != 0)
+    data_sent = ((flags & 0x06) == 0) & sent
+    data_received = ((flags & 0x06) == 0) & ~sent
+    source_scales, destination_scales = window_scales(data, ip, group, sent, handshake, groups)
+
+    # Fill the flow table columns straight from the per-connection arrays
+    flows = FlowTable()
+    columns = [
+        (flows.source_address, packets['source_address'][first]),
+        (flows.destination_address, packets['destination_address'][first]),
+        (flows.source_port, packets['source_port'][first]),
+        (flows.destination_port, packets['destination_port'][first]),
+        (flows.start_time, packets['timestamp'][first]),
+        (flows.end_time, packets['timestamp'][last]),
+        (flows.duration, np.zeros(groups)),
+        (flows.packets_sent, packets_sent), (flows.packets_received, packets_received),
+        (flows.bytes_sent, bytes_sent), (flows.bytes_received, bytes_received),
+        (flows.syn_count, syn_counts), (flows.fin_count, fin_counts), (flows.rst_count, rst_counts),
+        (flows.first_segment_syn, (flags[first] & 0x02) != 0),
+        (flows.source_window_scale, source_scales), (flows.destination_window_scale, destination_scales),
+    ]
+    for aggregate_columns, values in (
+            (flows.rtt_samples, rtt_samples),
+            (flows.handshake_windows, aggregate(group[handshake], windows[handshake], groups)),
+            (flows.windows_sent, aggregate(group[data_sent], windows[data_sent], groups)),
+            (flows.windows_received, aggregate(group[data_received], windows[data_received], groups))):
+        columns.extend(zip(aggregate_columns, values))
+    for column, values in columns:
+        column.frombytes(values.astype(column.typecode).tobytes())
+    flows.ids = dict(zip(map(normalize_connection_key, flows.source_address, flows.destination_address,
+                             flows.source_port, flows.destination_port), range(groups)))
+
+    flows.finish()
+    return flows
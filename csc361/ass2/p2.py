@@ -91,195 +91,544 @@ Output Format:
     END
 """
 
-import struct
+import argparse
+import mmap
+import multiprocessing
+import os
 import socket
+import struct
+import sys
+from array import array
+
+# The shared pcaptools package lives one directory up from the assignment folders
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pcaptools.decode import GLOBAL_HEADER
+from pcaptools.decode import decode_tcp_segment as parse_tcp_packet
+from pcaptools.decode import decode_window_scale
+from pcaptools.reader import CaptureFormat, iter_capture_file, iter_capture_records
+from pcaptools.reader import map_capture_file, read_capture_file
+from pcaptools.stats import RunningStats
+from rtt import RttTracker
+
+# Number of consecutive plausible record headers that must follow a guessed record boundary
+RESYNC_RECORDS = 16
+
+def aggregate_columns():
+    # Count, sum, minimum and maximum of a per-flow series of integer values
+    return array('Q'), array('Q'), array('Q'), array('Q')
+
+def add_sample(aggregate, flow_id, value):
+    count, total, minimum, maximum = aggregate
+    if not count[flow_id] or value < minimum[flow_id]:
+        minimum[flow_id] = value
+    if value > maximum[flow_id]:
+        maximum[flow_id] = value
+    count[flow_id] += 1
+    total[flow_id] += value
+
+def merge_samples(aggregate, flow_id, other, other_id):
+    count, total, minimum, maximum = aggregate
+    if other[0][other_id]:
+        if not count[flow_id] or other[2][other_id] < minimum[flow_id]:
+            minimum[flow_id] = other[2][other_id]
+        maximum[flow_id] = max(maximum[flow_id], other[3][other_id])
+        count[flow_id] += other[0][other_id]
+        total[flow_id] += other[1][other_id]
+
+def column(name):
+    # Property that reads and writes one column of the flow table at the view's flow id
+    def get(self):
+        return getattr(self.table, name)[self.flow_id]
+    def set(self, value):
+        getattr(self.table, name)[self.flow_id] = value
+    return property(get, set)
 
 class Connection:
-    def __init__(self, source_address, destination_address, source_port, destination_port):
-        self.source_address = source_address
-        self.destination_address = destination_address
-        self.source_port = source_port
-        self.destination_port = destination_port
-        self.status = None
-        self.start_time = None
-        self.end_time = None
-        self.duration = None
-        self.packets_sent = 0
-        self.packets_received = 0
-        self.bytes_sent = 0
-        self.bytes_received = 0
-        self.syn_count = 0
-        self.fin_count = 0
-        self.rst_count = 0
-        self.first_seg_syn = False
-
-    def calculate_duration(self):
-        if self.start_time and self.end_time:
-            self.duration = self.end_time - self.start_time
-
-    def determine_status(self):
-        self.status = f"S{self.syn_count}F{self.fin_count}"
-
-    def change_times(self, dif):
-        self.start_time -= dif
-        self.end_time -= dif
-
-def read_capture_file(file_path):
-    with open(file_path, 'rb') as file:
-        return file.read()
-
-def parse_global_header(data):
-    global_header_format = 'IHHIIII'
-    global_header_size = struct.calcsize(global_header_format)
-    global_header = struct.unpack(global_header_format, data[:global_header_size])
-    return global_header, data[global_header_size:]
-
-def parse_packet_header(data):
-    packet_header_format = 'IIII'
-    packet_header_size = struct.calcsize(packet_header_format)
-    packet_header = struct.unpack(packet_header_format, data[:packet_header_size])
-    return packet_header, data[packet_header_size:]
-
-def parse_tcp_packet(data):
-    ethernet_header_size = 14  # Ethernet header is 14 bytes
-    ip_header_size = 20  # IP header is typically 20 bytes (without options)
-    
-    # Unpack Ethernet header
-    ethernet_header = struct.unpack('!6s6sH', data[:ethernet_header_size])
-    
-    # Unpack IP header
-    ip_header = struct.unpack('!BBHHHBBH4s4s', data[ethernet_header_size:ethernet_header_size + ip_header_size])
-    
-    # Extract source and destination addresses
-    source_address = socket.inet_ntoa(ip_header[8])
-    destination_address = socket.inet_ntoa(ip_header[9])
-    
-    # Calculate the start of the TCP header
-    tcp_header_start = ethernet_header_size + ip_header_size
-    
-    # Unpack TCP header
-    tcp_header = struct.unpack('!HHLLBBHHH', data[tcp_header_start:tcp_header_start + 20])
-    
-    # Extract source and destination ports using bitwise operations
-    source_port = (data[tcp_header_start] << 8) | data[tcp_header_start + 1]
-    destination_port = (data[tcp_header_start + 2] << 8) | data[tcp_header_start + 3]
-    
-    # Extract TCP flags
-    flags = tcp_header[5]
-    
-    return source_address, destination_address, source_port, destination_port, flags
+    # Lightweight view of one flow in a FlowTable, so reports can keep using connection attributes
+    __slots__ = ('table', 'flow_id')
+
+    def __init__(self, table, flow_id):
+        self.table = table
+        self.flow_id = flow_id
+
+    source_port = column('source_port')
+    destination_port = column('destination_port')
+    start_time = column('start_time')
+    end_time = column('end_time')
+    packets_sent = column('packets_sent')
+    packets_received = column('packets_received')
+    bytes_sent = column('bytes_sent')
+    bytes_received = column('bytes_received')
+    syn_count = column('syn_count')
+    fin_count = column('fin_count')
+    rst_count = column('rst_count')
+    rtt_count = column('rtt_count')
+    rtt_total = column('rtt_total')
+
+    @property
+    def source_address(self):
+        return socket.inet_ntoa(self.table.source_address[self.flow_id].to_bytes(4, 'big'))
+
+    @property
+    def destination_address(self):
+        return socket.inet_ntoa(self.table.destination_address[self.flow_id].to_bytes(4, 'big'))
+
+    @property
+    def duration(self):
+        # Flows that never got a duration store 0.0, which reads back as "no duration" like None did
+        return self.table.duration[self.flow_id] or None
+
+    @property
+    def rtt_min(self):
+        # RTT statistics are kept in microseconds and reported in seconds
+        return self.table.rtt_min[self.flow_id] / 1000000
+
+    @property
+    def rtt_max(self):
+        return self.table.rtt_max[self.flow_id] / 1000000
+
+    @property
+    def window_count(self):
+        return self.table.window_stats(self.flow_id)[0]
+
+    @property
+    def window_total(self):
+        return self.table.window_stats(self.flow_id)[1]
+
+    @property
+    def window_min(self):
+        return self.table.window_stats(self.flow_id)[2]
+
+    @property
+    def window_max(self):
+        return self.table.window_stats(self.flow_id)[3]
+
+    @property
+    def status(self):
+        return f"S{self.syn_count}F{self.fin_count}"
+
+    @property
+    def first_segment_syn(self):
+        return bool(self.table.first_segment_syn[self.flow_id])
+
+class Summary:
+    # Counts and statistics for the general information and complete connection sections, gathered
+    # by FlowTable.finish during the walk over the flows it makes anyway
+    def __init__(self):
+        self.complete = 0
+        self.reset = 0
+        self.open = 0
+        self.pre_established = 0
+        self.durations = RunningStats()
+        # RTTs in microseconds and windows in bytes, over every sample of the complete connections
+        self.rtts = RunningStats()
+        self.packets = RunningStats()
+        self.windows = RunningStats()
+
+class FlowTable:
+    # Per-flow state kept in typed arrays indexed by an integer flow id instead of one object per
+    # connection, with flows looked up by their packed endpoint key
+    def __init__(self, resuming=False):
+        self.ids = {}
+        self.source_address = array('I')
+        self.destination_address = array('I')
+        self.source_port = array('H')
+        self.destination_port = array('H')
+        self.start_time = array('d')
+        self.end_time = array('d')
+        self.duration = array('d')
+        self.packets_sent = array('Q')
+        self.packets_received = array('Q')
+        self.bytes_sent = array('Q')
+        self.bytes_received = array('Q')
+        self.syn_count = array('I')
+        self.fin_count = array('I')
+        self.rst_count = array('I')
+        self.first_segment_syn = array('B')
+        # Round trip time samples in microseconds: how many, their sum and the extremes
+        self.rtt_samples = self.rtt_count, self.rtt_total, self.rtt_min, self.rtt_max = aggregate_columns()
+        self.rtt = RttTracker(resuming)
+        self.summary = Summary()
+        # Advertised receive windows as they appear in the headers. Windows of SYN segments are never
+        # scaled; the others are scaled by the sender's window scale option in window_stats, so the
+        # aggregates do not depend on having seen the handshake yet. -1 means no option seen.
+        self.handshake_windows = aggregate_columns()
+        self.windows_sent = aggregate_columns()
+        self.windows_received = aggregate_columns()
+        self.source_window_scale = array('b')
+        self.destination_window_scale = array('b')
+
+    def __len__(self):
+        return len(self.start_time)
+
+    def __getitem__(self, flow_id):
+        if not 0 <= flow_id < len(self):
+            raise IndexError(flow_id)
+        return Connection(self, flow_id)
+
+    def add(self, key, source_address, destination_address, source_port, destination_port, timestamp, first_segment_syn):
+        flow_id = len(self)
+        self.ids[key] = flow_id
+        self.source_address.append(source_address)
+        self.destination_address.append(destination_address)
+        self.source_port.append(source_port)
+        self.destination_port.append(destination_port)
+        self.start_time.append(timestamp)
+        self.end_time.append(timestamp)
+        self.duration.append(0.0)
+        for counters in (self.packets_sent, self.packets_received, self.bytes_sent, self.bytes_received,
+                         self.syn_count, self.fin_count, self.rst_count,
+                         *self.rtt_samples, *self.handshake_windows, *self.windows_sent, *self.windows_received):
+            counters.append(0)
+        self.first_segment_syn.append(1 if first_segment_syn else 0)
+        self.source_window_scale.append(-1)
+        self.destination_window_scale.append(-1)
+        return flow_id
+
+    def window_stats(self, flow_id):
+        # Count, sum, minimum and maximum of the flow's advertised windows in bytes. Scaling is only
+        # in effect when both ends offered the option in their SYN (RFC 7323)
+        source_scale = self.source_window_scale[flow_id]
+        destination_scale = self.destination_window_scale[flow_id]
+        if source_scale < 0 or destination_scale < 0:
+            source_scale = destination_scale = 0
+
+        count = total = 0
+        minimum = maximum = None
+        for (counts, totals, minimums, maximums), scale in ((self.handshake_windows, 0),
+                                                            (self.windows_sent, source_scale),
+                                                            (self.windows_received, destination_scale)):
+            if counts[flow_id]:
+                count += counts[flow_id]
+                total += totals[flow_id] << scale
+                if minimum is None or minimums[flow_id] << scale < minimum:
+                    minimum = minimums[flow_id] << scale
+                if maximum is None or maximums[flow_id] << scale > maximum:
+                    maximum = maximums[flow_id] << scale
+        return count, total, minimum or 0, maximum or 0
+
+    def merge(self, other):
+        # Fold in the flows of a table built from the records that come right after this one's,
+        # so the result matches parsing both ranges in one pass
+        for other_id, key in enumerate(other.ids):
+            flow_id = self.ids.get(key)
+            if flow_id is None:
+                flow_id = self.add(key, other.source_address[other_id], other.destination_address[other_id],
+                                   other.source_port[other_id], other.destination_port[other_id],
+                                   other.start_time[other_id], other.first_segment_syn[other_id])
+            self.end_time[flow_id] = other.end_time[other_id]
+            self.syn_count[flow_id] += other.syn_count[other_id]
+            self.fin_count[flow_id] += other.fin_count[other_id]
+            self.rst_count[flow_id] += other.rst_count[other_id]
+            merge_samples(self.rtt_samples, flow_id, other.rtt_samples, other_id)
+            merge_samples(self.handshake_windows, flow_id, other.handshake_windows, other_id)
+
+            # The other range may have first seen this flow from the opposite end
+            if other.source_address[other_id] == self.source_address[flow_id] and \
+                    other.source_port[other_id] == self.source_port[flow_id]:
+                self.packets_sent[flow_id] += other.packets_sent[other_id]
+                self.packets_received[flow_id] += other.packets_received[other_id]
+                self.bytes_sent[flow_id] += other.bytes_sent[other_id]
+                self.bytes_received[flow_id] += other.bytes_received[other_id]
+                merge_samples(self.windows_sent, flow_id, other.windows_sent, other_id)
+                merge_samples(self.windows_received, flow_id, other.windows_received, other_id)
+                source_scale, destination_scale = other.source_window_scale, other.destination_window_scale
+            else:
+                self.packets_sent[flow_id] += other.packets_received[other_id]
+                self.packets_received[flow_id] += other.packets_sent[other_id]
+                self.bytes_sent[flow_id] += other.bytes_received[other_id]
+                self.bytes_received[flow_id] += other.bytes_sent[other_id]
+                merge_samples(self.windows_sent, flow_id, other.windows_received, other_id)
+                merge_samples(self.windows_received, flow_id, other.windows_sent, other_id)
+                source_scale, destination_scale = other.destination_window_scale, other.source_window_scale
+
+            # Like a single pass, keep the first window scale option each end sent
+            if self.source_window_scale[flow_id] < 0:
+                self.source_window_scale[flow_id] = source_scale[other_id]
+            if self.destination_window_scale[flow_id] < 0:
+                self.destination_window_scale[flow_id] = destination_scale[other_id]
+
+        # Segments the other range could not match without knowing what came before are matched here
+        for key, direction, sample in self.rtt.absorb(other.rtt):
+            flow_id = self.ids[key]
+            source = self.source_address[flow_id] << 16 | self.source_port[flow_id]
+            if direction == (0 if source == key >> 48 else 1):
+                add_sample(self.rtt_samples, flow_id, sample)
+
+    def finish(self):
+        summary = self.summary = Summary()
+        if not len(self):
+            return
+        ## Find start time of first connection
+        first_start_time = min(self.start_time)
+
+        start_time, end_time, duration = self.start_time, self.end_time, self.duration
+        for flow_id in range(len(self)):
+            if start_time[flow_id] and end_time[flow_id]:
+                duration[flow_id] = end_time[flow_id] - start_time[flow_id]
+            start_time[flow_id] -= first_start_time
+            end_time[flow_id] -= first_start_time
+
+            if self.rst_count[flow_id]:
+                summary.reset += 1
+            if not self.first_segment_syn[flow_id]:
+                summary.pre_established += 1
+            if self.fin_count[flow_id]:
+                summary.complete += 1
+                summary.durations.add(duration[flow_id])
+                summary.packets.add(self.packets_sent[flow_id] + self.packets_received[flow_id])
+                summary.rtts.add_group(self.rtt_count[flow_id], self.rtt_total[flow_id],
+                                       self.rtt_min[flow_id], self.rtt_max[flow_id])
+                summary.windows.add_group(*self.window_stats(flow_id))
+            else:
+                summary.open += 1
+
+def index_record_offsets(data):
+    # Pre-scan the capture for the offset of every record, touching only the record headers
+    packet_header = CaptureFormat(data).packet_header
+    offsets = array('q')
+    offset = GLOBAL_HEADER.size
+    end = len(data)
+    packet_header_size = packet_header.size
+    unpack_from = packet_header.unpack_from
+    while offset + packet_header_size <= end:
+        next_offset = offset + packet_header_size + unpack_from(data, offset)[2]
+        if next_offset > end:
+            # A truncated last record is dropped, as the record readers drop it
+            break
+        offsets.append(offset)
+        offset = next_offset
+    return offsets
+
+def resync_record_offset(data, offset, capture_format):
+    # First offset at or after offset where RESYNC_RECORDS plausible record headers chain back to
+    # back (or up to the end of the capture), which is taken to be a record boundary
+    end = len(data)
+    packet_header_size = capture_format.packet_header.size
+    unpack_from = capture_format.packet_header.unpack_from
+    snaplen = capture_format.snaplen
+    ticks_per_second = capture_format.ticks_per_second
+    while offset < end:
+        probe = offset
+        for _ in range(RESYNC_RECORDS):
+            if probe == end:
+                return offset
+            if probe + packet_header_size > end:
+                break
+            timestamp, fraction, included_length, original_length = unpack_from(data, probe)
+            if fraction >= ticks_per_second or included_length > original_length or included_length > snaplen:
+                break
+            probe += packet_header_size + included_length
+        else:
+            return offset
+        if probe == end:
+            return offset
+        offset += 1
+    return end
+
+def split_record_ranges(data, parts):
+    # Cut the capture into byte ranges of similar size by resyncing on a record boundary near each
+    # cut, so no worker has to wait for a walk over every record header first
+    capture_format = CaptureFormat(data)
+    start = GLOBAL_HEADER.size
+    end = len(data)
+    cuts = [start]
+    for part in range(1, parts):
+        cut = resync_record_offset(data, start + (end - start) * part // parts, capture_format)
+        if cut > cuts[-1]:
+            cuts.append(cut)
+    cuts.append(end)
+    return [(cuts[i], cuts[i + 1]) for i in range(len(cuts) - 1) if cuts[i] < cuts[i + 1]]
 
 def normalize_connection_key(source_address, destination_address, source_port, destination_port):
-    if (source_address, source_port) < (destination_address, destination_port):
-        return (source_address, destination_address, source_port, destination_port)
+    # Pack both (address, port) endpoints of an IPv4 connection into one int, lower endpoint first
+    source = source_address << 16 | source_port
+    destination = destination_address << 16 | destination_port
+    if source < destination:
+        return source << 48 | destination
     else:
-        return (destination_address, source_address, destination_port, source_port)
+        return destination << 48 | source
 
 def parse_capture_data(data):
-    connections = {}
-    global_header, data = parse_global_header(data)
-    
-    while data:
-        packet_header, data = parse_packet_header(data)
-        packet_data = data[:packet_header[2]]
-        data = data[packet_header[2]:]
+    # Accept either a whole capture in memory or a stream of (packet header, packet data) records
+    if isinstance(data, (bytes, bytearray, memoryview, mmap.mmap)):
+        records = iter_capture_records(data)
+    else:
+        records = data
+
+    flows = collect_flows(records)
+    flows.finish()
+    return flows
+
+def parse_capture_range(file_path, start, stop):
+    # Worker side of parse_capture_parallel: the flows seen in one record-aligned byte range
+    records = iter_capture_records(map_capture_file(file_path), start, stop)
+    return collect_flows(records, resuming=start != GLOBAL_HEADER.size)
+
+def parse_capture_parallel(file_path, workers):
+    data = map_capture_file(file_path)
+    ranges = split_record_ranges(data, workers)
+    try:
+        with multiprocessing.Pool(workers) as pool:
+            partials = pool.starmap(parse_capture_range, [(file_path, start, stop) for start, stop in ranges])
+    except (ValueError, IndexError, struct.error):
+        # A resync landed inside a record, so its range decoded garbage (a bad header, or a
+        # length or option running off its packet); fall back to one pass over the whole capture
+        return parse_capture_data(data)
+
+    # Merge in capture order so every flow keeps the start of its first packet and the end of its last
+    flows = FlowTable()
+    for partial in partials:
+        flows.merge(partial)
+    flows.finish()
+    return flows
+
+def collect_flows(records, resuming=False):
+    flows = FlowTable(resuming)
+    rtt = flows.rtt
+
+    ids = flows.ids
+    end_time = flows.end_time
+    syn_count, fin_count, rst_count = flows.syn_count, flows.fin_count, flows.rst_count
+    packets_sent, packets_received = flows.packets_sent, flows.packets_received
+    bytes_sent, bytes_received = flows.bytes_sent, flows.bytes_received
+    rtt_samples, handshake_windows = flows.rtt_samples, flows.handshake_windows
+    windows_sent, windows_received = flows.windows_sent, flows.windows_received
+
+    for packet_header, packet_data in records:
         
-        source_address, destination_address, source_port, destination_port, flags = parse_tcp_packet(packet_data)
-        timestamp = packet_header[0]
-        timestampus = packet_header[1]
+        (source_address, destination_address, source_port, destination_port,
+         seq, ack, flags, window, payload_length) = parse_tcp_packet(packet_data)
+        timestamp = packet_header[0] + packet_header[1] / 1000000
         
         connection_key = normalize_connection_key(source_address, destination_address, source_port, destination_port)
         
-        if connection_key not in connections:
-            connections[connection_key] = Connection(source_address, destination_address, source_port, destination_port)
-            connections[connection_key].start_time = timestamp + timestampus / 1000000
+        flow_id = ids.get(connection_key)
+        if flow_id is None:
             # Check if the first segment is a SYN
-            if flags & 0x02:
-                connections[connection_key].first_segment_syn = True
+            flow_id = flows.add(connection_key, source_address, destination_address, source_port, destination_port, timestamp, flags & 0x02)
         
-        connection = connections[connection_key]
-        connection.end_time = timestamp + timestampus / 1000000
-
+        end_time[flow_id] = timestamp
         
         # Check for SYN flag (0x02)
         if flags & 0x02:
-            connection.syn_count += 1
-        """# Check for ACK flag (0x10)
-        elif flags & 0x10:
-            connection.packets_received += 1"""
+            syn_count[flow_id] += 1
         # Check for FIN flag (0x01)
         if flags & 0x01:
-            connection.fin_count += 1
+            fin_count[flow_id] += 1
         # Check for RST flag (0x04)
         if flags & 0x04:
-            connection.rst_count += 1
+            rst_count[flow_id] += 1
 
-        if source_address == connection.source_address and source_port == connection.source_port:
-            connection.packets_sent += 1
-            # Update byte counts (assuming the entire packet is data for simplicity)
-            connection.bytes_sent += len(packet_data)
+        from_source = source_address == flows.source_address[flow_id] and source_port == flows.source_port[flow_id]
+        if from_source:
+            packets_sent[flow_id] += 1
+            bytes_sent[flow_id] += payload_length
         else:
-            connection.packets_received += 1
-            # Update byte counts (assuming the entire packet is data for simplicity)
-            connection.bytes_received += len(packet_data)
-    
-    ## Find start time of first connection
-    first_start_time = min([conn.start_time for conn in connections.values()])
-
-    for conn in connections.values():
-        conn.calculate_duration()
-        conn.determine_status()
-        conn.change_times(first_start_time)
-    
-    return list(connections.values())
-
-def print_results(connections):
-    print(f"A) Total number of connections: {len(connections)}")
-    print("_________________________________________________________")
-    print("B) Connection Details")
+            packets_received[flow_id] += 1
+            bytes_received[flow_id] += payload_length
+
+        # A reset carries no meaningful window
+        if not flags & 0x04:
+            if flags & 0x02:
+                # Each end offers its window scale in its SYN; the SYN's own window is never scaled
+                add_sample(handshake_windows, flow_id, window)
+                window_scale = decode_window_scale(packet_data)
+                if window_scale is not None:
+                    scales = flows.source_window_scale if from_source else flows.destination_window_scale
+                    if scales[flow_id] < 0:
+                        scales[flow_id] = window_scale
+            else:
+                add_sample(windows_sent if from_source else windows_received, flow_id, window)
+
+        # Sequence space the segment takes up: its payload, plus one each for SYN and FIN
+        length = payload_length + (flags >> 1 & 1) + (flags & 0x01)
+        direction = 0 if (source_address << 16 | source_port) < (destination_address << 16 | destination_port) else 1
+        sample = rtt.segment(connection_key, direction, packet_header[0] * 1000000 + packet_header[1],
+                             seq, ack, length, flags)
+        # Only ACKs coming back to the source time its segments; the other way round would time the
+        # source host's own ACK delay
+        if sample is not None and not from_source:
+            add_sample(rtt_samples, flow_id, sample)
+
+    return flows
+
+def print_results(connections, out=sys.stdout):
+    # Each connection's block is written with one call instead of a print per line
+    write = out.write
+    write(f"A) Total number of connections: {len(connections)}\n"
+          "_________________________________________________________\n"
+          "B) Connection Details\n")
     for i, conn in enumerate(connections, 1):
-        print(f"Connection {i}:")
-        print(f"Source Address: {conn.source_address}")
-        print(f"Destination address: {conn.destination_address}")
-        print(f"Source Port: {conn.source_port}")
-        print(f"Destination Port: {conn.destination_port}")
-        print(f"Status: {conn.status}")
+        lines = [
+            f"Connection {i}:",
+            f"Source Address: {conn.source_address}",
+            f"Destination address: {conn.destination_address}",
+            f"Source Port: {conn.source_port}",
+            f"Destination Port: {conn.destination_port}",
+            f"Status: {conn.status}",
+        ]
         if conn.duration:
-            print(f"Start time: {conn.start_time:.4f}s")
-            print(f"End Time: {conn.end_time:.4f}s")
-            print(f"Duration: {conn.duration:.4f}s")
-            print(f"Number of packets sent from Source to Destination: {conn.packets_sent}")
-            print(f"Number of packets sent from Destination to Source: {conn.packets_received}")
-            print(f"Total number of packets: {conn.packets_sent + conn.packets_received}")
-            print(f"Number of data bytes sent from Source to Destination: {conn.bytes_sent}")
-            print(f"Number of data bytes sent from Destination to Source: {conn.bytes_received}")
-            print(f"Total number of data bytes: {conn.bytes_sent + conn.bytes_received}")
-        print("END")
-        print("+++++++++++++++++++++++++++++++++")
-
-    print("_________________________________________________________")
-    print("C) General Information")
-    print(f"Total number of complete TCP connections: {len([conn for conn in connections if conn.fin_count >= 1])}")
-    print(f"Number of reset TCP connections: {len([conn for conn in connections if conn.rst_count >= 1])}")
-    print(f"Number of TCP connections that were still open when the trace capture ended: {len([conn for conn in connections if conn.fin_count == 0])}")
-    print(f"Number of TCP connections established before the capture started: {len([conn for conn in connections if not conn.first_segment_syn])}")
-    print("_________________________________________________________")
-    print("D) Complete TCP Connections")
-    durations = [conn.duration for conn in connections if conn.fin_count >= 1]
-    rtts = [conn.duration for conn in connections if conn.fin_count >= 1]
-    packets = [conn.packets_sent + conn.packets_received for conn in connections if conn.fin_count >= 1]
-    receive_window_sizes = [0 for conn in connections if conn.fin_count >= 1]
-    print(f"Minimum time duration: {min(durations):.4f}")
-    print(f"Mean time duration: {sum(durations) / len(durations):.4f}")
-    print(f"Maximum time duration: {max(durations):.4f}")
-    print(f"Minimum RTT value: {min(rtts):.4f}")
-    print(f"Mean RTT value: {sum(rtts) / len(rtts):.4f}")
-    print(f"Maximum RTT value: {max(rtts):.4f}")
-    print(f"Minimum number of packets including both send/received: {min(packets)}")
-    print(f"Mean number of packets including both send/received: {sum(packets) / len(packets):.0f}")
-    print(f"Maximum number of packets including both send/received: {max(packets)}")
+            lines += [
+                f"Start time: {conn.start_time:.4f}s",
+                f"End Time: {conn.end_time:.4f}s",
+                f"Duration: {conn.duration:.4f}s",
+                f"Number of packets sent from Source to Destination: {conn.packets_sent}",
+                f"Number of packets sent from Destination to Source: {conn.packets_received}",
+                f"Total number of packets: {conn.packets_sent + conn.packets_received}",
+                f"Number of data bytes sent from Source to Destination: {conn.bytes_sent}",
+                f"Number of data bytes sent from Destination to Source: {conn.bytes_received}",
+                f"Total number of data bytes: {conn.bytes_sent + conn.bytes_received}",
+            ]
+        lines += ["END", "+++++++++++++++++++++++++++++++++", ""]
+        write("\n".join(lines))
+
+    # Everything below was gathered by FlowTable.finish, so the flows are not walked again
+    summary = connections.summary
+    durations, rtts, packets, windows = summary.durations, summary.rtts, summary.packets, summary.windows
+    write("_________________________________________________________\n"
+          "C) General Information\n"
+          f"Total number of complete TCP connections: {summary.complete}\n"
+          f"Number of reset TCP connections: {summary.reset}\n"
+          f"Number of TCP connections that were still open when the trace capture ended: {summary.open}\n"
+          f"Number of TCP connections established before the capture started: {summary.pre_established}\n"
+          "_________________________________________________________\n"
+          "D) Complete TCP Connections\n"
+          f"Minimum time duration: {durations.minimum or 0:.4f}\n"
+          f"Mean time duration: {durations.mean:.4f}\n"
+          f"Maximum time duration: {durations.maximum or 0:.4f}\n"
+          # RTT statistics are taken over every sample of the complete connections, not per connection
+          f"Minimum RTT value: {(rtts.minimum or 0) / 1000000:.4f}\n"
+          f"Mean RTT value: {rtts.mean / 1000000:.4f}\n"
+          f"Maximum RTT value: {(rtts.maximum or 0) / 1000000:.4f}\n"
+          f"Minimum number of packets including both send/received: {packets.minimum or 0}\n"
+          f"Mean number of packets including both send/received: {packets.mean:.0f}\n"
+          f"Maximum number of packets including both send/received: {packets.maximum or 0}\n"
+          # Like the RTT, window statistics cover every segment of the complete connections
+          f"Minimum receive window size including both send/received: {windows.minimum or 0}\n"
+          f"Mean receive window size including both send/received: {windows.mean:.0f}\n"
+          f"Maximum receive window size including both send/received: {windows.maximum or 0}\n")
+    out.flush()
 
 if __name__ == "__main__":
-    capture_data = read_capture_file('sample-capture-file.cap')
-    connections = parse_capture_data(capture_data)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', nargs='?', default='sample-capture-file.cap', help='The capture file to analyze')
+    parser.add_argument('--engine', choices=['python', 'numpy'], default='python',
+                        help='Decode packet by packet, or in vectorized batches with NumPy (needs numpy)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of processes that parse separate parts of the capture (python engine only)')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.workers > 1 and args.engine != 'python':
+        parser.error('--workers is only supported by the python engine')
+
+    if args.workers > 1:
+        connections = parse_capture_parallel(args.filename, args.workers)
+    elif args.engine == 'numpy':
+        from columnar import parse_capture_columns
+        connections = parse_capture_columns(map_capture_file(args.filename))
+    else:
+        connections = parse_capture_data(iter_capture_file(args.filename))
     print_results(connections)
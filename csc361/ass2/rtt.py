@@ -0,0 +1,181 @@
+"""
+Round trip time estimation for p2.
+
+Every direction of a flow keeps an ordered index of its outstanding segments, keyed by the
+relative sequence number just past the end of each segment. An ACK from the other direction
+is matched with a binary search for the last segment it covers, which gives one RTT sample,
+and everything it covers leaves the index. The SYN and FIN each take up one sequence number,
+so the SYN -> SYN-ACK exchange is matched like any data segment.
+
+Karn's rule: a segment that is sent again is marked as retransmitted and never yields a
+sample, because the ACK cannot say which transmission it answers.
+
+Times are integer microseconds, so samples and their sums are exact.
+"""
+
+from bisect import bisect_left, bisect_right
+
+SEQUENCE_MASK = 0xFFFFFFFF
+
+# Outstanding segments kept per direction; the oldest is dropped once a flow has this many
+MAX_OUTSTANDING = 4096
+
+# Consumed entries are only cut off the front of the index once this many have piled up
+COMPACT_AFTER = 64
+
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+ACK = 0x10
+
+class SegmentIndex:
+    # Outstanding segments sent in one direction of a flow, in sequence order
+    __slots__ = ('isn', 'highest', 'ends', 'times', 'head', 'finished')
+
+    def __init__(self, isn):
+        self.isn = isn
+        self.highest = 0
+        self.ends = []
+        self.times = []
+        self.head = 0
+        self.finished = False
+
+    def send(self, seq, length, timestamp):
+        start = (seq - self.isn) & SEQUENCE_MASK
+        end = start + length
+        ends = self.ends
+
+        if start < self.highest:
+            # Karn's rule: any outstanding segment this one overlaps was retransmitted
+            first = bisect_right(ends, start, self.head)
+            last = min(bisect_left(ends, end, first) + 1, len(ends))
+            for i in range(first, last):
+                self.times[i] = None
+
+        if end > self.highest:
+            ends.append(end)
+            self.times.append(timestamp)
+            self.highest = end
+            if len(ends) - self.head > MAX_OUTSTANDING:
+                self.head += 1
+                self.compact()
+
+    def ack(self, ack, timestamp):
+        relative = (ack - self.isn) & SEQUENCE_MASK
+        if relative > self.highest:
+            # Acknowledges data that was never seen in this capture
+            return None
+
+        i = bisect_right(self.ends, relative, self.head)
+        if i == self.head:
+            return None
+        sent = self.times[i - 1]
+        self.head = i
+        self.compact()
+        if sent is None or timestamp < sent:
+            return None
+        return timestamp - sent
+
+    def compact(self):
+        if self.head >= COMPACT_AFTER and self.head * 2 >= len(self.ends):
+            del self.ends[:self.head]
+            del self.times[:self.head]
+            self.head = 0
+
+    def idle(self):
+        return self.head == len(self.ends)
+
+class RttTracker:
+    # Segment indexes of every open flow, keyed by the packed connection key. Direction 0 is
+    # traffic from the lower endpoint of the key to the higher one.
+    #
+    # A tracker that resumes partway through a capture cannot know the state its flows were in.
+    # Until a flow reaches a point that no longer depends on earlier packets (a RST, or a SYN
+    # without ACK once the other side has acknowledged it) its segments are only logged in
+    # pending. The tracker for the earlier part of the capture replays them later with absorb.
+    def __init__(self, resuming=False):
+        self.indexes = {}
+        self.resuming = resuming
+        self.known = set()
+        self.pending = {}
+        self.handshakes = {}
+
+    def segment(self, key, direction, timestamp, seq, ack, length, flags):
+        if self.resuming and key not in self.known:
+            self.hold(key, direction, timestamp, seq, ack, length, flags)
+            return None
+        return self.track(key, direction, timestamp, seq, ack, length, flags)
+
+    def hold(self, key, direction, timestamp, seq, ack, length, flags):
+        segments = self.pending.setdefault(key, [])
+        segments.append((direction, timestamp, seq, ack, length, flags))
+        if flags & RST:
+            self.known.add(key)
+        elif flags & SYN and not flags & ACK:
+            self.handshakes[key] = (direction, (seq + 1) & SEQUENCE_MASK)
+        elif flags & ACK and self.handshakes.get(key) == (1 - direction, ack):
+            # The SYN is acknowledged, so rebuilding the flow from the logged segments gives the
+            # same state whatever came before; the samples are left for absorb to take
+            self.known.add(key)
+            del self.handshakes[key]
+            for segment in segments:
+                self.track(key, *segment)
+
+    def track(self, key, direction, timestamp, seq, ack, length, flags):
+        if flags & RST:
+            self.indexes.pop(key, None)
+            return None
+
+        pair = self.indexes.get(key)
+        retransmitted_syn = False
+        if flags & SYN and not flags & ACK:
+            # A new handshake starts the flow over; the same SYN sent again keeps Karn's rule
+            old = pair[direction] if pair is not None else None
+            retransmitted_syn = old is not None and old.isn == seq and old.highest == 1 and old.head == 0
+            pair = None
+        if pair is None:
+            pair = self.indexes[key] = [None, None]
+
+        sample = None
+        if flags & ACK:
+            other = pair[1 - direction]
+            if other is not None:
+                sample = other.ack(ack, timestamp)
+
+        if length:
+            own = pair[direction]
+            if own is None:
+                own = pair[direction] = SegmentIndex(seq)
+            own.send(seq, length, timestamp)
+            if retransmitted_syn:
+                own.times[-1] = None
+            if flags & FIN:
+                own.finished = True
+
+        # Forget flows that both sides have closed once everything they sent is acknowledged
+        if pair[0] is not None and pair[1] is not None and pair[0].finished and pair[1].finished \
+                and pair[0].idle() and pair[1].idle():
+            del self.indexes[key]
+
+        return sample
+
+    def absorb(self, other):
+        # Continue this tracker with one that resumed where it stopped. Replays the other's pending
+        # segments and yields (key, direction, sample) for each RTT sample they produce, where
+        # direction is the one the timed segment was sent in.
+        if not other.resuming:
+            self.indexes.update(other.indexes)
+            return
+
+        for key, segments in other.pending.items():
+            for segment in segments:
+                sample = self.track(key, *segment)
+                if sample is not None:
+                    yield key, 1 - segment[0], sample
+
+        # From the point it stopped logging a flow, the other tracker's view of it is the right one
+        for key in other.known:
+            if key in other.indexes:
+                self.indexes[key] = other.indexes[key]
+            else:
+                self.indexes.pop(key, None)
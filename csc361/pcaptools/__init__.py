@@ -0,0 +1,3 @@
+"""
+Shared pcap decoding helpers used by the CSC 361 analyzers.
+"""
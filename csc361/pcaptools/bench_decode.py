@@ -0,0 +1,123 @@
+"""
+Micro-benchmark for the shared pcaptools reader and header decoders.
+
+Decodes every packet of a capture with the original per-packet parser (format strings,
+three full header unpacks and byte-by-byte ports) and with decode_tcp_segment, the
+precompiled single-pass decoder p2 uses, and reports packets/sec for each. It then times the
+readers of pcaptools.reader on their own (walking the capture in memory and streaming it from
+disk) and together with the decoder, which is the path every analyzer takes.
+
+Usage:
+
+    python3 ./bench_decode.py [capture file] [--repeat N]
+"""
+
+import argparse
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pcaptools.decode import GLOBAL_HEADER, PACKET_HEADER, decode_tcp_segment
+from pcaptools.reader import iter_capture_file, iter_capture_records
+
+DEFAULT_CAPTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'ass2', 'sample-capture-file.cap')
+
+def legacy_parse_packet_header(data):
+    packet_header_format = 'IIII'
+    packet_header_size = struct.calcsize(packet_header_format)
+    packet_header = struct.unpack(packet_header_format, data[:packet_header_size])
+    return packet_header, data[packet_header_size:]
+
+def legacy_parse_tcp_packet(data):
+    ethernet_header_size = 14
+    ip_header_size = 20
+    ethernet_header = struct.unpack('!6s6sH', data[:ethernet_header_size])
+    ip_header = struct.unpack('!BBHHHBBH4s4s', data[ethernet_header_size:ethernet_header_size + ip_header_size])
+    source_address = socket.inet_ntoa(ip_header[8])
+    destination_address = socket.inet_ntoa(ip_header[9])
+    tcp_header_start = ethernet_header_size + ip_header_size
+    tcp_header = struct.unpack('!HHLLBBHHH', data[tcp_header_start:tcp_header_start + 20])
+    source_port = (data[tcp_header_start] << 8) | data[tcp_header_start + 1]
+    destination_port = (data[tcp_header_start + 2] << 8) | data[tcp_header_start + 3]
+    flags = tcp_header[5]
+    return source_address, destination_address, source_port, destination_port, flags
+
+def to_strings(fields):
+    # The decoder keeps addresses as ints until a report needs them, the legacy parser made strings
+    # p2 also takes lengths, sequence numbers and the window, which the legacy parser did not return
+    source, destination, source_port, destination_port = fields[:4]
+    flags = fields[6]
+    return (socket.inet_ntoa(source.to_bytes(4, 'big')), socket.inet_ntoa(destination.to_bytes(4, 'big')),
+            source_port, destination_port, flags)
+
+def load_records(file_path):
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    records = []
+    offset = GLOBAL_HEADER.size
+    while offset < len(data):
+        records.append(data[offset:offset + PACKET_HEADER.size + PACKET_HEADER.unpack_from(data, offset)[2]])
+        offset += len(records[-1])
+    return records
+
+def run_legacy(records):
+    for record in records:
+        packet_header, packet_data = legacy_parse_packet_header(record)
+        legacy_parse_tcp_packet(packet_data)
+
+def run_decoder(records):
+    # The legacy parser skipped a 14 byte Ethernet header, the decoder takes the IPv4 packet
+    ip_offset = PACKET_HEADER.size + 14
+    view = memoryview
+    for record in records:
+        packet_header = PACKET_HEADER.unpack_from(record)
+        decode_tcp_segment(view(record)[ip_offset:])
+
+def run_walk(data):
+    for packet_header, packet in iter_capture_records(data):
+        pass
+
+def run_stream(file_path):
+    for packet_header, packet in iter_capture_file(file_path):
+        pass
+
+def run_reader_decoder(data):
+    for packet_header, packet in iter_capture_records(data):
+        decode_tcp_segment(packet)
+
+def measure(function, argument, packets, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return packets / best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', nargs='?', default=DEFAULT_CAPTURE, help='The capture to decode')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of timed passes, the best is reported')
+    args = parser.parse_args()
+
+    records = load_records(args.filename)
+    with open(args.filename, 'rb') as file:
+        data = file.read()
+    if [legacy_parse_tcp_packet(legacy_parse_packet_header(r)[1]) for r in records] != \
+            [to_strings(decode_tcp_segment(packet)) for _, packet in iter_capture_records(data)]:
+        sys.exit('Decoders disagree on ' + args.filename)
+
+    packets = len(records)
+    before = measure(run_legacy, records, packets, args.repeat)
+    after = measure(run_decoder, records, packets, args.repeat)
+    print(f"Packets: {packets}")
+    print(f"Before: {before:,.0f} packets/sec")
+    print(f"After: {after:,.0f} packets/sec")
+    print(f"Speedup: {after / before:.2f}x")
+    print(f"Reader, in memory: {measure(run_walk, data, packets, args.repeat):,.0f} packets/sec")
+    print(f"Reader, streaming: {measure(run_stream, args.filename, packets, args.repeat):,.0f} packets/sec")
+    print(f"Reader and decoder: {measure(run_reader_decoder, data, packets, args.repeat):,.0f} packets/sec")
@@ -0,0 +1,134 @@
+"""
+On-disk cache of analysis results, keyed by capture content.
+
+An entry is found by a BLAKE2b digest of the capture's bytes together with the name and version
+of the analysis that produced it, so a changed capture or a changed parser never sees a stale
+result. Hashing a capture still reads all of it, so the digest of every path is remembered with
+the file size and modification time it had; while those are unchanged the digest is reused
+without reading the file.
+
+Entries are zlib-compressed pickles written atomically (to a temporary file that is then renamed
+into place), so several processes can share a cache directory. Reading an entry touches its
+modification time, and once the entries take up more than the size cap the least recently used
+ones are removed, along with remembered digests.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+import zlib
+
+from pcaptools.reader import CHUNK_SIZE
+
+# Total size of the cached entries before the least recently used are removed
+CACHE_SIZE_CAP = 64 << 20
+
+ENTRY_SUFFIX = '.entry'
+DIGEST_SUFFIX = '.digest'
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'csc361')
+
+def content_digest(file_path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class AnalysisCache:
+    def __init__(self, directory=None, size_cap=CACHE_SIZE_CAP):
+        self.directory = directory or default_cache_dir()
+        self.size_cap = size_cap
+        self.hits = 0
+        self.misses = 0
+
+    def digest(self, file_path):
+        # Content digest of a capture, reused while its size and modification time are unchanged
+        status = os.stat(file_path)
+        stamp = f'{os.path.abspath(file_path)}\0{status.st_size}\0{status.st_mtime_ns}'
+        name = hashlib.blake2b(stamp.encode(), digest_size=16).hexdigest() + DIGEST_SUFFIX
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path) as file:
+                digest = file.read()
+            os.utime(path)
+            return digest
+        except OSError:
+            pass
+        digest = content_digest(file_path)
+        self.write(name, digest.encode())
+        return digest
+
+    def entry_path(self, file_path, analysis, version):
+        key = f'{self.digest(file_path)}\0{analysis}\0{version}'
+        return os.path.join(self.directory, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + ENTRY_SUFFIX)
+
+    def get(self, file_path, analysis, version):
+        # The cached result of an analysis of this capture, or None
+        return self.load(self.entry_path(file_path, analysis, version))
+
+    def put(self, file_path, analysis, version, value):
+        self.store(self.entry_path(file_path, analysis, version), value)
+
+    def cached(self, file_path, analysis, version, analyze):
+        # analyze(file_path) through the cache
+        path = self.entry_path(file_path, analysis, version)
+        value = self.load(path)
+        if value is None:
+            value = analyze(file_path)
+            self.store(path, value)
+        return value
+
+    def load(self, path):
+        try:
+            with open(path, 'rb') as file:
+                value = pickle.loads(zlib.decompress(file.read()))
+            os.utime(path)
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def store(self, path, value):
+        self.write(os.path.basename(path), zlib.compress(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+        self.evict()
+
+    def write(self, name, data):
+        os.makedirs(self.directory, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, os.path.join(self.directory, name))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    def evict(self):
+        # Remove the least recently used entries and digests until the rest fit under the size cap
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith((ENTRY_SUFFIX, DIGEST_SUFFIX)):
+                    try:
+                        status = entry.stat()
+                    except OSError:
+                        continue
+                    entries.append((status.st_mtime_ns, status.st_size, entry.path))
+                    total += status.st_size
+        if total <= self.size_cap:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+            if total <= self.size_cap:
+                break
@@ -0,0 +1,80 @@
+"""
+Precompiled struct codecs for the pcap file format and the IPv4/TCP headers.
+
+Every layout is compiled once at import time, and each decoder pulls only the fields the
+analyzers actually use out of a packet with one unpack_from call per header, without slicing.
+Decoders take the IPv4 packet itself, as pcaptools.reader yields it with the link layer header
+stripped. Header lengths are taken from the IPv4 IHL and TCP data offset fields rather than
+assumed.
+"""
+
+import socket
+import struct
+
+# Headers in the byte order of this host; pcaptools.reader.CaptureFormat picks the one a capture
+# was actually written in
+GLOBAL_HEADER = struct.Struct('IHHIIII')
+PACKET_HEADER = struct.Struct('IIII')
+
+# Full fixed part of an IPv4 header and the first 8 bytes of an ICMP message
+IPV4_HEADER = struct.Struct('!BBHHHBBH4s4s')
+ICMP_HEADER = struct.Struct('!BBHHH')
+
+# IPv4 version/IHL byte and total length, then the addresses as big-endian integers
+IPV4_PREFIX = struct.Struct('!BxH8xII')
+
+# Fixed part of a TCP header: ports, sequence and acknowledgement numbers, data offset byte,
+# flags and window
+TCP_HEADER = struct.Struct('!HHIIBBH')
+
+# TCP option kinds
+TCP_OPTION_END = 0
+TCP_OPTION_NOP = 1
+TCP_OPTION_WINDOW_SCALE = 3
+
+# Largest shift count a window scale option may ask for (RFC 7323)
+MAX_WINDOW_SCALE = 14
+
+# Source/destination address from an IPv4 header
+IP_ADDRESSES = struct.Struct('!12x4s4s')
+
+def parse_global_header(data, offset=0):
+    return GLOBAL_HEADER.unpack_from(data, offset), offset + GLOBAL_HEADER.size
+
+def parse_packet_header(data, offset=0):
+    return PACKET_HEADER.unpack_from(data, offset), offset + PACKET_HEADER.size
+
+def decode_tcp_segment(data):
+    # The TCP header starts after IHL words of IPv4 header, and the payload after data offset
+    # words of TCP header, so options on either side are skipped instead of read as data
+    version_ihl, total_length, source, destination = IPV4_PREFIX.unpack_from(data)
+    ip_header_length = (version_ihl & 0x0F) * 4
+    source_port, destination_port, seq, ack, data_offset, flags, window = \
+        TCP_HEADER.unpack_from(data, ip_header_length)
+    payload_length = total_length - ip_header_length - (data_offset >> 4) * 4
+    return (source, destination, source_port, destination_port, seq, ack, flags, window,
+            payload_length if payload_length > 0 else 0)
+
+def decode_window_scale(data):
+    # Shift count of the window scale option of a TCP segment, or None if it does not carry one
+    tcp_start = (data[0] & 0x0F) * 4
+    # Options follow the 20 byte fixed header, after the checksum and urgent pointer
+    offset = tcp_start + 20
+    end = min(tcp_start + (data[tcp_start + 12] >> 4) * 4, len(data))
+    while offset < end:
+        kind = data[offset]
+        if kind == TCP_OPTION_END:
+            break
+        if kind == TCP_OPTION_NOP:
+            offset += 1
+            continue
+        if offset + 1 >= end or data[offset + 1] < 2:
+            break
+        if kind == TCP_OPTION_WINDOW_SCALE and data[offset + 1] == 3 and offset + 2 < end:
+            return min(data[offset + 2], MAX_WINDOW_SCALE)
+        offset += data[offset + 1]
+    return None
+
+def decode_ip_addresses(data):
+    source, destination = IP_ADDRESSES.unpack_from(data)
+    return socket.inet_ntoa(source), socket.inet_ntoa(destination)
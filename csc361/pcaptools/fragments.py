@@ -0,0 +1,125 @@
+"""
+IPv4 fragment reassembly.
+
+Fragments are grouped by (source, destination, protocol, identification), as in RFC 791. Each
+partial datagram keeps the byte ranges it has received as a sorted list of disjoint intervals,
+merged as fragments arrive, so a duplicate or overlapping fragment costs a binary search and
+completion is known as soon as one interval spans the whole datagram. The payload is copied
+into a buffer that grows to the highest offset seen.
+
+All partial datagrams together may hold at most a memory budget of payload bytes, and each one
+at most a timeout after its first fragment arrived; past either limit the oldest are dropped,
+like a host's reassembly queue does. Times are integer microseconds.
+"""
+
+import struct
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+# Payload bytes held across all partial datagrams (Linux uses 4 MB by default)
+MEMORY_BUDGET = 4 << 20
+
+# Partial datagrams older than this are dropped (Linux uses 30 seconds by default)
+REASSEMBLY_TIMEOUT = 30 * 1000000
+
+MORE_FRAGMENTS = 0x2000
+DONT_FRAGMENT = 0x4000
+OFFSET_MASK = 0x1FFF
+
+class PartialDatagram:
+    # Received ranges are kept as parallel lists of interval starts and ends
+    __slots__ = ('header', 'data', 'starts', 'ends', 'total', 'fragments', 'last_offset', 'timestamp')
+
+    def __init__(self, timestamp):
+        self.header = None
+        self.data = bytearray()
+        self.starts = []
+        self.ends = []
+        self.total = None
+        self.fragments = 0
+        self.last_offset = 0
+        self.timestamp = timestamp
+
+    def add(self, header, offset, payload, more):
+        # Copy one fragment in and return the number of payload bytes it added to the buffer
+        end = offset + len(payload)
+        grown = max(end - len(self.data), 0)
+        if grown:
+            self.data.extend(bytes(grown))
+        self.data[offset:end] = payload
+        self.fragments += 1
+        self.last_offset = max(self.last_offset, offset)
+        if offset == 0:
+            self.header = bytes(header)
+        if not more:
+            self.total = end
+
+        # Merge [offset, end) with every interval it overlaps or touches
+        starts, ends = self.starts, self.ends
+        first = bisect_left(ends, offset)
+        last = bisect_right(starts, end)
+        if first < last:
+            offset = min(offset, starts[first])
+            end = max(end, ends[last - 1])
+        starts[first:last] = [offset]
+        ends[first:last] = [end]
+        return grown
+
+    def complete(self):
+        return self.header is not None and self.total is not None and len(self.starts) == 1 \
+            and self.starts[0] == 0 and self.ends[0] >= self.total
+
+    def datagram(self):
+        # The whole datagram, with the first fragment's header marked as unfragmented
+        header = bytearray(self.header)
+        struct.pack_into('!H', header, 2, len(header) + self.total)
+        flags = struct.unpack_from('!H', header, 6)[0]
+        struct.pack_into('!H', header, 6, flags & DONT_FRAGMENT)
+        return bytes(header) + bytes(self.data[:self.total])
+
+class Reassembler:
+    # Partial datagrams in the order their first fragment arrived, so the oldest can be dropped
+    # from the front
+    def __init__(self, memory_budget=MEMORY_BUDGET, timeout=REASSEMBLY_TIMEOUT):
+        self.memory_budget = memory_budget
+        self.timeout = timeout
+        self.partial = OrderedDict()
+        self.held = 0
+        self.completed = 0
+        self.evicted = 0
+
+    def fragment(self, packet, ip_header, timestamp):
+        # Add one fragment, given the packet and its unpacked IPV4_HEADER. Returns
+        # (datagram, fragment count, last fragment offset in bytes, first fragment's timestamp)
+        # when it completes a datagram, otherwise None
+        self.expire(timestamp)
+        key = (ip_header[8], ip_header[9], ip_header[6], ip_header[3])
+        partial = self.partial.get(key)
+        if partial is None:
+            partial = self.partial[key] = PartialDatagram(timestamp)
+
+        header_length = (ip_header[0] & 0x0F) * 4
+        total_length = min(ip_header[2], len(packet))
+        offset = (ip_header[4] & OFFSET_MASK) * 8
+        self.held += partial.add(packet[:header_length], offset, packet[header_length:total_length],
+                                 ip_header[4] & MORE_FRAGMENTS)
+
+        if partial.complete():
+            del self.partial[key]
+            self.held -= len(partial.data)
+            self.completed += 1
+            return partial.datagram(), partial.fragments, partial.last_offset, partial.timestamp
+
+        # Over budget: drop the oldest datagrams, which may include this one
+        while self.held > self.memory_budget and self.partial:
+            self.drop()
+        return None
+
+    def expire(self, now):
+        while self.partial and now - next(iter(self.partial.values())).timestamp > self.timeout:
+            self.drop()
+
+    def drop(self):
+        _, partial = self.partial.popitem(last=False)
+        self.held -= len(partial.data)
+        self.evicted += 1
@@ -0,0 +1,65 @@
+"""
+Counters and stage timers for the analyzers.
+
+A Collector is handed to the parts of an analysis that should report on themselves. They add to
+named counters (bytes scanned, records decoded, probes matched, ...) and to the wall time of
+named stages, and collectors from separate worker processes merge into one. Nothing is counted
+per packet unless a collector was asked for: the readers and align_data only add their totals
+once they finish, so an analysis without --stats pays nothing for this.
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+class Collector:
+    def __init__(self):
+        self.counters = {}
+        self.seconds = {}
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def add_time(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, records, name):
+        # Yield from records, adding the time spent producing them (reading and walking the
+        # capture) to stage name; what the caller does with each record is not included
+        clock = time.perf_counter
+        iterator = iter(records)
+        elapsed = 0.0
+        try:
+            while True:
+                start = clock()
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    elapsed += clock() - start
+                    return
+                elapsed += clock() - start
+                yield record
+        finally:
+            self.add_time(name, elapsed)
+
+    def merge(self, other):
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+        for name, seconds in other.seconds.items():
+            self.add_time(name, seconds)
+
+    def as_dict(self):
+        return {'counters': dict(sorted(self.counters.items())),
+                'seconds': {name: round(seconds, 6) for name, seconds in sorted(self.seconds.items())}}
+
+    def dump(self, out):
+        json.dump(self.as_dict(), out, indent=2)
+        out.write('\n')
@@ -0,0 +1,159 @@
+"""
+Traceroute probe -> reply matching.
+
+Outgoing probes are kept in a hash index keyed by what identifies them in a reply: the
+destination address, the protocol, and the UDP source port (Linux traceroute) or the ICMP echo
+identifier and sequence number (Windows tracert). An ICMP time exceeded or destination
+unreachable message quotes the IPv4 header and first eight bytes of the probe that triggered it,
+so the same key is read back out of the quote; an echo reply carries the identifier and
+sequence number of its request itself. Each reply is then one dictionary lookup.
+
+Probes leave the index as soon as they are answered, and unanswered ones once they are older
+than the timeout or the index holds too many, so memory stays bounded on long traces.
+
+Times are integer microseconds, so RTTs are exact.
+"""
+
+import socket
+import struct
+from collections import OrderedDict
+
+from pcaptools.decode import ICMP_HEADER, IPV4_HEADER
+
+# Probes left unanswered for this long are dropped (traceroute waits 5 seconds by default)
+PROBE_TIMEOUT = 30 * 1000000
+
+# Unanswered probes kept at most; the oldest is dropped once there are more
+MAX_OUTSTANDING = 4096
+
+ICMP = 1
+UDP = 17
+
+ICMP_ECHO_REPLY = 0
+ICMP_DESTINATION_UNREACHABLE = 3
+ICMP_ECHO_REQUEST = 8
+ICMP_TIME_EXCEEDED = 11
+
+PORTS = struct.Struct('!HH')
+
+def probe_key(packet, ip_header):
+    # Key of an outgoing UDP or ICMP echo probe, or None if the packet is neither. ip_header is
+    # the packet's unpacked IPV4_HEADER. Only first fragments carry the transport header
+    if ip_header[4] & 0x1FFF:
+        return None
+    start = (ip_header[0] & 0x0F) * 4
+    protocol = ip_header[6]
+    if protocol == UDP and len(packet) >= start + PORTS.size:
+        return ip_header[9], UDP, PORTS.unpack_from(packet, start)[0]
+    if protocol == ICMP and len(packet) >= start + ICMP_HEADER.size:
+        icmp_header = ICMP_HEADER.unpack_from(packet, start)
+        if icmp_header[0] == ICMP_ECHO_REQUEST:
+            return ip_header[9], ICMP, icmp_header[3] << 16 | icmp_header[4]
+    return None
+
+def reply_key(packet, ip_header):
+    # Key of the probe an ICMP reply answers, or None if the packet is not such a reply
+    start = (ip_header[0] & 0x0F) * 4
+    if ip_header[6] != ICMP or ip_header[4] & 0x1FFF or len(packet) < start + ICMP_HEADER.size:
+        return None
+    icmp_header = ICMP_HEADER.unpack_from(packet, start)
+    if icmp_header[0] == ICMP_ECHO_REPLY:
+        return ip_header[8], ICMP, icmp_header[3] << 16 | icmp_header[4]
+    if icmp_header[0] not in (ICMP_TIME_EXCEEDED, ICMP_DESTINATION_UNREACHABLE):
+        return None
+
+    # The quoted probe starts after the 8 byte ICMP header
+    quoted = start + 8
+    if len(packet) < quoted + IPV4_HEADER.size:
+        return None
+    inner_header = IPV4_HEADER.unpack_from(packet, quoted)
+    if inner_header[4] & 0x1FFF:
+        # A later fragment of the probe was quoted, which carries no transport header
+        return None
+    inner_start = quoted + (inner_header[0] & 0x0F) * 4
+    protocol = inner_header[6]
+    if protocol == UDP and len(packet) >= inner_start + PORTS.size:
+        return inner_header[9], UDP, PORTS.unpack_from(packet, inner_start)[0]
+    if protocol == ICMP and len(packet) >= inner_start + ICMP_HEADER.size:
+        inner_icmp = ICMP_HEADER.unpack_from(packet, inner_start)
+        return inner_header[9], ICMP, inner_icmp[3] << 16 | inner_icmp[4]
+    return None
+
+class ProbeMatcher:
+    # Outstanding probes in the order they were sent, so the oldest can be expired from the front
+    def __init__(self, timeout=PROBE_TIMEOUT, max_outstanding=MAX_OUTSTANDING):
+        self.timeout = timeout
+        self.max_outstanding = max_outstanding
+        self.probes = OrderedDict()
+        self.matched = 0
+        self.expired = 0
+
+    def probe(self, key, ttl, timestamp):
+        # A probe sent again with the same key replaces the earlier one and moves to the back
+        probes = self.probes
+        probes.pop(key, None)
+        probes[key] = (ttl, timestamp)
+        self.expire(timestamp)
+
+    def reply(self, key, timestamp):
+        # (probe TTL, RTT) of the probe this reply answers, or None if it is not outstanding
+        probe = self.probes.pop(key, None)
+        if probe is None:
+            return None
+        ttl, sent = probe
+        if timestamp < sent:
+            return None
+        self.matched += 1
+        return ttl, timestamp - sent
+
+    def expire(self, now):
+        probes = self.probes
+        while probes and (len(probes) > self.max_outstanding or
+                          now - next(iter(probes.values()))[1] > self.timeout):
+            probes.popitem(last=False)
+            self.expired += 1
+
+    def packet(self, packet, ip_header, timestamp):
+        # Feed one IPv4 packet and its unpacked IPV4_HEADER. Returns (router address, probe TTL,
+        # RTT) when it answers a probe
+        key = reply_key(packet, ip_header)
+        if key is not None:
+            match = self.reply(key, timestamp)
+            if match is not None:
+                return socket.inet_ntoa(ip_header[8]), match[0], match[1]
+            return None
+        key = probe_key(packet, ip_header)
+        if key is not None:
+            self.probe(key, ip_header[5], timestamp)
+        return None
+
+class HopIndex:
+    # Routers on a route in the order they were first seen, each with the lowest TTL of a probe it
+    # answered (None until it answers one). The dict gives O(1) membership and keeps the order
+    __slots__ = ('ttls',)
+
+    def __init__(self):
+        self.ttls = {}
+
+    def add(self, address, ttl=None):
+        ttls = self.ttls
+        if address not in ttls:
+            ttls[address] = ttl
+        elif ttl is not None and (ttls[address] is None or ttl < ttls[address]):
+            ttls[address] = ttl
+
+    def __contains__(self, address):
+        return address in self.ttls
+
+    def __iter__(self):
+        return iter(self.ttls)
+
+    def __len__(self):
+        return len(self.ttls)
+
+    def route(self):
+        # The routers ordered by distance, i.e. by the lowest TTL that reached them. The sort is
+        # stable, so routers at the same TTL keep the order they were seen in, and routers that
+        # never answered a probe come last
+        ttls = self.ttls
+        return sorted(ttls, key=lambda address: (ttls[address] is None, ttls[address] or 0))
@@ -0,0 +1,186 @@
+"""
+Pcap readers shared by the analyzers: a streaming reader for files and a record walker for
+captures already in memory.
+
+The global header decides how the records are read. Its magic number gives the byte order the
+capture was written in and whether timestamps count microseconds or nanoseconds, and its link
+type says which link layer header precedes the network layer. Both readers yield
+(packet header, packet) records where the packet header is (seconds, microseconds, included
+length, original length) whatever the capture's resolution, and the packet is a memoryview of
+the IPv4 packet with the link layer header already stripped. Frames that do not carry IPv4
+(ARP, IPv6, ...) are skipped, and so is a last record cut short by the end of the capture.
+"""
+
+import mmap
+import struct
+
+from pcaptools.decode import GLOBAL_HEADER
+
+# Number of bytes read from disk at a time when streaming a capture
+CHUNK_SIZE = 1 << 20
+
+MAGIC_MICROSECONDS = 0xa1b2c3d4
+MAGIC_NANOSECONDS = 0xa1b23c4d
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+# Raw IP is 12 or 14 on some BSDs rather than 101
+LINKTYPE_RAW_BSD = (12, 14)
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+
+class CaptureFormat:
+    # What the global header says about reading the rest of a capture
+    __slots__ = ('byte_order', 'nanoseconds', 'snaplen', 'link_type', 'global_header', 'packet_header')
+
+    def __init__(self, data):
+        if len(data) < GLOBAL_HEADER.size:
+            raise ValueError("Capture is shorter than a pcap global header")
+        magic = struct.unpack_from('<I', data)[0]
+        if magic in (MAGIC_MICROSECONDS, MAGIC_NANOSECONDS):
+            self.byte_order = '<'
+        else:
+            magic = struct.unpack_from('>I', data)[0]
+            if magic not in (MAGIC_MICROSECONDS, MAGIC_NANOSECONDS):
+                raise ValueError(f"Not a pcap capture (magic number {magic:#010x})")
+            self.byte_order = '>'
+        self.nanoseconds = magic == MAGIC_NANOSECONDS
+        self.global_header = struct.Struct(self.byte_order + 'IHHIIII')
+        self.packet_header = struct.Struct(self.byte_order + 'IIII')
+        global_header = self.global_header.unpack_from(data)
+        self.snaplen = global_header[5]
+        # The upper bits of the link type field can carry FCS information
+        self.link_type = global_header[6] & 0x0FFFFFFF
+        if self.link_type not in (LINKTYPE_ETHERNET, LINKTYPE_RAW, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2) \
+                and self.link_type not in LINKTYPE_RAW_BSD:
+            raise ValueError(f"Unsupported link type {self.link_type}")
+
+    @property
+    def ticks_per_second(self):
+        return 1000000000 if self.nanoseconds else 1000000
+
+    def network_offset(self, frame):
+        # Offset of the IPv4 header in a frame of this capture's link type, or None if the frame
+        # does not carry IPv4
+        link_type = self.link_type
+        if link_type == LINKTYPE_ETHERNET:
+            if len(frame) < 14:
+                return None
+            ethertype = frame[12] << 8 | frame[13]
+            if ethertype == ETHERTYPE_VLAN and len(frame) >= 18:
+                ethertype = frame[16] << 8 | frame[17]
+                offset = 18
+            else:
+                offset = 14
+        elif link_type == LINKTYPE_LINUX_SLL:
+            if len(frame) < 16:
+                return None
+            ethertype = frame[14] << 8 | frame[15]
+            offset = 16
+        elif link_type == LINKTYPE_LINUX_SLL2:
+            if len(frame) < 20:
+                return None
+            ethertype = frame[0] << 8 | frame[1]
+            offset = 20
+        else:
+            return 0 if len(frame) and frame[0] >> 4 == 4 else None
+        return offset if ethertype == ETHERTYPE_IPV4 else None
+
+def read_capture_file(file_path):
+    with open(file_path, 'rb') as file:
+        return file.read()
+
+def map_capture_file(file_path):
+    # Map the file instead of reading it so pages are only loaded as the parser walks over them
+    with open(file_path, 'rb') as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def iter_capture_file(file_path, chunk_size=CHUNK_SIZE, stats=None):
+    # Read the capture in fixed-size chunks and yield each record as soon as it is complete, so
+    # memory is bounded by the chunk size rather than by the capture. A pcaptools.instrument
+    # Collector passed as stats gets the bytes scanned and frames skipped once the walk stops
+    with open(file_path, 'rb') as file:
+        capture_format = CaptureFormat(file.read(GLOBAL_HEADER.size))
+        unpack_from = capture_format.packet_header.unpack_from
+        packet_header_size = capture_format.packet_header.size
+        network_offset = capture_format.network_offset
+        nanoseconds = capture_format.nanoseconds
+        buffer = b''
+        offset = 0
+        scanned = GLOBAL_HEADER.size
+        skipped = 0
+        try:
+            for chunk in iter(lambda: file.read(chunk_size), b''):
+                # Carry over the partial record left at the end of the previous chunk
+                scanned += offset
+                buffer = buffer[offset:] + chunk
+                view = memoryview(buffer)
+                offset = 0
+                while offset + packet_header_size <= len(buffer):
+                    packet_header = unpack_from(view, offset)
+                    end = offset + packet_header_size + packet_header[2]
+                    if end > len(buffer):
+                        break
+                    frame = view[offset + packet_header_size:end]
+                    offset = end
+                    start = network_offset(frame)
+                    if start is None:
+                        skipped += 1
+                        continue
+                    if nanoseconds:
+                        packet_header = (packet_header[0], packet_header[1] // 1000, packet_header[2], packet_header[3])
+                    yield packet_header, frame[start:]
+        finally:
+            if stats is not None:
+                stats.count('bytes_scanned', scanned + offset)
+                stats.count('frames_skipped', skipped)
+
+def iter_capture_records(data, start=None, stop=None, stats=None):
+    # Walk the records by offset over a view of the buffer so packet bytes are never copied. Each
+    # record is visited once, following its included length. The global header at the start of
+    # data is read even when the walk starts at a later record. stats is as for iter_capture_file
+    data = memoryview(data)
+    capture_format = CaptureFormat(data)
+    offset = capture_format.global_header.size if start is None else start
+    end = len(data) if stop is None else stop
+
+    unpack_from = capture_format.packet_header.unpack_from
+    packet_header_size = capture_format.packet_header.size
+    network_offset = capture_format.network_offset
+    nanoseconds = capture_format.nanoseconds
+    first = offset
+    skipped = 0
+    truncated = False
+    try:
+        while offset < end:
+            # A last record cut short by the end of the capture is dropped, as the streaming
+            # reader drops it, so every reader sees the same records
+            if offset + packet_header_size > len(data):
+                truncated = True
+                break
+            packet_header = unpack_from(data, offset)
+            if offset + packet_header_size + packet_header[2] > len(data):
+                truncated = True
+                break
+            offset += packet_header_size
+            frame = data[offset:offset + packet_header[2]]
+            offset += packet_header[2]
+            frame_start = network_offset(frame)
+            if frame_start is None:
+                skipped += 1
+                continue
+            if nanoseconds:
+                packet_header = (packet_header[0], packet_header[1] // 1000, packet_header[2], packet_header[3])
+            yield packet_header, frame[frame_start:]
+    finally:
+        if stats is not None:
+            stats.count('bytes_scanned', offset - first)
+            stats.count('frames_skipped', skipped)
+
+    # A range that was cut at a guessed boundary must end exactly where the next one starts, or
+    # at a truncated last record when it runs to the end of the capture
+    if stop is not None and offset != stop and not (truncated and stop == len(data)):
+        raise ValueError(f"Record walk ended at offset {offset} instead of {stop}")
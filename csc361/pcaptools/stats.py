@@ -0,0 +1,128 @@
+"""
+Streaming summary statistics.
+
+RunningStats keeps the count, minimum, maximum, mean and variance of a series of values in
+constant space. Single values are folded in with Welford's update; groups that are already
+summarized (a count, total, minimum and maximum) are combined with Chan's parallel formula.
+
+Variances and standard deviations are population ones, dividing by the count rather than by one
+less, both in RunningStats and in stdev, so the traceroute report and table agree on every hop.
+
+QuantileSketch estimates quantiles of non-negative values in bounded space, in the manner of
+DDSketch: values are counted in logarithmic buckets whose bounds are a factor gamma apart, so any
+quantile it reports is within the relative accuracy of a value that really was added. Sketches
+of separate series merge by adding bucket counts. Once there are more buckets than the limit the
+lowest ones are folded together, which only costs accuracy at the low end. Quantiles follow the
+nearest-rank rule: the q-quantile of n values is the ceil(q * n)-th smallest.
+"""
+
+import math
+
+def stdev(data):
+    n = len(data)
+    mean = sum(data) / n
+    return (sum((x - mean) ** 2 for x in data) / n) ** 0.5
+
+class RunningStats:
+    __slots__ = ('count', 'mean', 'm2', 'minimum', 'maximum')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    def add_group(self, count, total, minimum, maximum, m2=0.0):
+        # Fold in a group of count values summing to total. Without the group's own m2 the variance
+        # only reflects how far the group mean lies from the others
+        if not count:
+            return
+        mean = total / count
+        combined = self.count + count
+        delta = mean - self.mean
+        self.m2 += m2 + delta * delta * self.count * count / combined
+        self.mean += delta * count / combined
+        self.count = combined
+        if self.minimum is None or minimum < self.minimum:
+            self.minimum = minimum
+        if self.maximum is None or maximum > self.maximum:
+            self.maximum = maximum
+
+    def merge(self, other):
+        self.add_group(other.count, other.mean * other.count, other.minimum, other.maximum, other.m2)
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else 0.0
+
+# Relative error of the quantiles a QuantileSketch reports
+SKETCH_ACCURACY = 0.01
+
+# Buckets a QuantileSketch keeps at most; at 1% accuracy 1024 buckets span nine orders of magnitude
+SKETCH_BUCKETS = 1024
+
+class QuantileSketch:
+    __slots__ = ('gamma', 'log_gamma', 'max_buckets', 'buckets', 'zeros', 'count')
+
+    def __init__(self, accuracy=SKETCH_ACCURACY, max_buckets=SKETCH_BUCKETS):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value):
+        self.count += 1
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        buckets = self.buckets
+        buckets[key] = buckets.get(key, 0) + 1
+        if len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def merge(self, other):
+        # Only sketches built with the same accuracy can be merged
+        buckets = self.buckets
+        for key, count in other.buckets.items():
+            buckets[key] = buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        if len(buckets) > self.max_buckets:
+            self.collapse()
+
+    def collapse(self):
+        # Fold the lowest buckets into the lowest one that is kept
+        keys = sorted(self.buckets)
+        excess = keys[:len(keys) - self.max_buckets + 1]
+        folded = sum(self.buckets.pop(key) for key in excess)
+        self.buckets[excess[-1]] = folded
+
+    def quantile(self, q):
+        # Estimate of the q-quantile (0 <= q <= 1), or None for an empty sketch
+        if not self.count:
+            return None
+        # Zero-based nearest rank, so the 95th percentile of 3 values is the largest, not the median
+        rank = max(math.ceil(q * self.count) - 1, 0)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # The middle of the bucket, in relative terms
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
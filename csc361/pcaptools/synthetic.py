@@ -0,0 +1,181 @@
+"""
+Deterministic synthetic TCP captures for benchmarking the analyzers.
+
+Writes a little-endian, microsecond pcap of Ethernet/IPv4/TCP frames. Flows are interleaved
+the way a busy link would show them, and each one is built from a seeded random generator,
+so the same options always give a byte-identical file. A flow can open with a handshake (with
+MSS and window scale options) or start mid-connection, exchange data segments with ACKs, and
+end with a FIN teardown, a RST, or not at all (still open when the capture ends).
+
+Usage:
+
+    python3 ./synthetic.py output.cap [--flows N] [--packets-per-flow N] [--size 100MB] ...
+"""
+
+import argparse
+import os
+import random
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from pcaptools.decode import GLOBAL_HEADER, PACKET_HEADER
+
+PCAP_MAGIC = 0xa1b2c3d4
+LINKTYPE_ETHERNET = 1
+SNAPLEN = 65535
+
+ETHERNET_HEADER = b'\x02\x00\x00\x00\x00\x01\x02\x00\x00\x00\x00\x02\x08\x00'
+IPV4_HEADER = struct.Struct('!BBHHHBBH4s4s')
+TCP_HEADER = struct.Struct('!HHIIBBHHH')
+
+FIN = 0x01
+SYN = 0x02
+RST = 0x04
+PSH = 0x08
+ACK = 0x10
+
+# MSS 1460, NOP, window scale 7, padded to a multiple of four bytes
+SYN_OPTIONS = b'\x02\x04\x05\xb4\x01\x03\x03\x07'
+
+# Frames are written in batches of this many bytes
+WRITE_BUFFER = 1 << 20
+
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1 << 10, 'MB': 1 << 20, 'GB': 1 << 30}
+
+def parse_size(text):
+    # "512", "64KB", "1MB", "10GB" -> bytes
+    text = text.strip().upper()
+    number = text.rstrip('KMGB')
+    unit = text[len(number):]
+    if unit not in SIZE_UNITS or not number:
+        raise ValueError(f"Unknown size: {text}")
+    return int(float(number) * SIZE_UNITS[unit])
+
+def build_frame(source, destination, source_port, destination_port, seq, ack, flags, window,
+                payload_length, options=b''):
+    tcp_length = TCP_HEADER.size + len(options)
+    ip_header = IPV4_HEADER.pack(0x45, 0, 20 + tcp_length + payload_length, 0, 0x4000, 64, 6, 0,
+                                 source, destination)
+    tcp_header = TCP_HEADER.pack(source_port, destination_port, seq, ack, (tcp_length // 4) << 4, flags,
+                                 window, 0, 0)
+    return ETHERNET_HEADER + ip_header + tcp_header + options + bytes(payload_length)
+
+def flow_segments(rng, packets, handshake, teardown, reset, max_payload):
+    # Yield (from_client, flags, payload length, options) for one flow, keeping the sequence
+    # numbers of both ends consistent so RTT matching sees a realistic exchange
+    client_seq = rng.getrandbits(32)
+    server_seq = rng.getrandbits(32)
+    sent = 0
+
+    if handshake and packets >= 3:
+        yield True, SYN, 0, SYN_OPTIONS, client_seq, 0
+        client_seq = (client_seq + 1) & 0xFFFFFFFF
+        yield False, SYN | ACK, 0, SYN_OPTIONS, server_seq, client_seq
+        server_seq = (server_seq + 1) & 0xFFFFFFFF
+        yield True, ACK, 0, b'', client_seq, server_seq
+        sent = 3
+
+    ending = 'fin' if teardown else 'rst' if reset else None
+    closing = {'fin': 3, 'rst': 1, None: 0}[ending]
+    from_client = True
+    while sent < packets - closing:
+        length = rng.randint(1, max_payload) if rng.random() < 0.7 else 0
+        if from_client:
+            yield True, PSH | ACK if length else ACK, length, b'', client_seq, server_seq
+            client_seq = (client_seq + length) & 0xFFFFFFFF
+        else:
+            yield False, PSH | ACK if length else ACK, length, b'', server_seq, client_seq
+            server_seq = (server_seq + length) & 0xFFFFFFFF
+        from_client = not from_client if length else rng.random() < 0.5
+        sent += 1
+
+    if ending == 'fin':
+        yield True, FIN | ACK, 0, b'', client_seq, server_seq
+        client_seq = (client_seq + 1) & 0xFFFFFFFF
+        yield False, FIN | ACK, 0, b'', server_seq, client_seq
+        server_seq = (server_seq + 1) & 0xFFFFFFFF
+        yield True, ACK, 0, b'', client_seq, server_seq
+    elif ending == 'rst':
+        yield rng.random() < 0.5, RST | ACK, 0, b'', client_seq, server_seq
+
+def generate_capture(file_path, flows=1000, packets_per_flow=20, handshake=0.9, teardown=0.7, reset=0.1,
+                     concurrency=64, max_payload=1460, size=None, seed=361):
+    # Write the capture and return (flows, packets, bytes) written. With size, flows keep being
+    # started until the file reaches that many bytes and the flows argument is ignored
+    rng = random.Random(seed)
+    timestamp = 1_000_000_000 * 1000000
+    active = []
+    started = packets = 0
+    written = GLOBAL_HEADER.size
+    buffer = []
+    buffered = 0
+
+    def start_flow(index):
+        client = bytes((10, (index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF or 1))
+        server = bytes((192, 168, rng.randint(0, 255), rng.randint(1, 254)))
+        endpoints = (client, server, 1024 + index % 64000, rng.choice((80, 443, 8080)))
+        # Spread packet counts around the requested mean
+        count = max(1, int(rng.expovariate(1 / packets_per_flow)) if packets_per_flow > 1 else 1)
+        ends_with_fin = rng.random() < teardown
+        segments = flow_segments(rng, count, rng.random() < handshake, ends_with_fin,
+                                 not ends_with_fin and rng.random() < reset, max_payload)
+        return endpoints, segments
+
+    with open(file_path, 'wb') as file:
+        file.write(GLOBAL_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, SNAPLEN, LINKTYPE_ETHERNET))
+        while True:
+            want_more = written < size if size is not None else started < flows
+            while want_more and len(active) < concurrency:
+                active.append(start_flow(started))
+                started += 1
+                want_more = written < size if size is not None else started < flows
+            if not active:
+                break
+
+            index = rng.randrange(len(active))
+            (client, server, client_port, server_port), segments = active[index]
+            segment = next(segments, None)
+            if segment is None:
+                active[index] = active[-1]
+                active.pop()
+                continue
+
+            from_client, flags, length, options, seq, ack = segment
+            if from_client:
+                frame = build_frame(client, server, client_port, server_port, seq, ack, flags, 502, length, options)
+            else:
+                frame = build_frame(server, client, server_port, client_port, seq, ack, flags, 1024, length, options)
+            timestamp += rng.randint(1, 2000)
+            buffer.append(PACKET_HEADER.pack(timestamp // 1000000, timestamp % 1000000, len(frame), len(frame)))
+            buffer.append(frame)
+            buffered += PACKET_HEADER.size + len(frame)
+            packets += 1
+            if buffered >= WRITE_BUFFER:
+                file.write(b''.join(buffer))
+                written += buffered
+                buffer = []
+                buffered = 0
+
+        file.write(b''.join(buffer))
+        written += buffered
+    return started, packets, written
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filename', help='The capture file to write')
+    parser.add_argument('--flows', type=int, default=1000, help='Number of flows to generate')
+    parser.add_argument('--packets-per-flow', type=int, default=20, help='Mean number of packets in a flow')
+    parser.add_argument('--size', type=parse_size, help='Keep adding flows until the file is this large, e.g. 1MB or 10GB')
+    parser.add_argument('--handshake', type=float, default=0.9, help='Fraction of flows that start with a handshake')
+    parser.add_argument('--teardown', type=float, default=0.7, help='Fraction of flows that end with a FIN teardown')
+    parser.add_argument('--reset', type=float, default=0.1, help='Fraction of the other flows that end with a RST')
+    parser.add_argument('--concurrency', type=int, default=64, help='Number of flows interleaved at any time')
+    parser.add_argument('--seed', type=int, default=361, help='Random seed')
+    args = parser.parse_args()
+
+    flows, packets, size = generate_capture(args.filename, args.flows, args.packets_per_flow, args.handshake,
+                                            args.teardown, args.reset, args.concurrency, size=args.size,
+                                            seed=args.seed)
+    print(f"Wrote {flows} flows, {packets} packets, {size} bytes to {args.filename}")
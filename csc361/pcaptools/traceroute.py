@@ -0,0 +1,211 @@
+"""
+Traceroute capture analysis shared by P3_Fall2024 and tablemaker.
+
+align_data walks a capture once, record by record. Every IPv4 packet's addresses, protocol and
+fragmentation fields are noted, fragments are reassembled before probe matching, and each ICMP
+reply is paired with the probe it answers for per-hop RTTs. The fields the reports need are
+then taken out of the resulting TracerouteInfo, and analyze_trace keeps them in the on-disk
+analysis cache so a capture that has not changed is only parsed once, whichever tool asks.
+"""
+
+import functools
+import logging
+import socket
+
+from pcaptools.decode import ICMP_HEADER, IPV4_HEADER
+from pcaptools.fragments import Reassembler
+from pcaptools.probes import HopIndex, ProbeMatcher
+from pcaptools.reader import iter_capture_file, iter_capture_records
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever align_data changes what it reports, so cached analyses are redone
+ANALYSIS_VERSION = 2
+
+# What the reports need from a trace, and all that the analysis cache keeps of it
+REPORT_FIELDS = ('source_address', 'destination_address', 'intermediate_addresses', 'protocol_values',
+                 'fragment_count', 'last_fragment_offset', 'fragments', 'rtt_values', 'rtts', 'sent_packets')
+
+class ICMP_Packet:
+    def __init__(self):
+        self.source_address = None
+        self.destination_address = None
+        self.type = 0
+        self.timestamp = None
+        self.count = 0
+
+class TracerouteInfo:
+    def __init__(self):
+        self.source_address = None
+        self.destination_address = None
+        self.ICMP_packets = []
+        self.intermediate_addresses = HopIndex()
+        self.start_time = None
+        self.end_time = None
+        # Used as an insertion-ordered set
+        self.protocol_values = {}
+        self.fragment_count = 0
+        self.last_fragment_offset = 0
+        self.fragments = {}
+        self.rtt_values = {}
+        self.sd_values = {}
+        self.sent_packets = []
+        self.packets = []
+        self.rtts = []
+
+def align_data(data, info, stats=None):
+    # Walk the capture record by record, following each record's included length, so every
+    # packet is visited exactly once. The reader strips the link layer header, so each record's
+    # packet data starts at its IPv4 header. data is either the whole capture in memory or a
+    # stream of (packet header, packet data) records. When a Collector is given as stats, the
+    # time spent reading records and the packet, probe and fragment totals are added to it
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        logger.info("Data length: %d", len(data))
+        records = iter_capture_records(data, stats=stats)
+    else:
+        records = data
+    if stats is not None:
+        records = stats.timed(records, 'read')
+
+    accepted_protocols = [1, 6, 17]
+    reassembler = Reassembler()
+    matcher = ProbeMatcher()
+    # Checked once, so the per-packet lines cost one test each when debug logging is off
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    i = 0
+    for packet_header, packet_data in records:
+        if len(packet_data) < IPV4_HEADER.size:
+            continue
+
+        ip_header = IPV4_HEADER.unpack_from(packet_data)
+        ip_version = ip_header[0] >> 4
+        protocol = ip_header[6]
+        if ip_version != 4 or protocol not in accepted_protocols:
+            continue
+
+        if protocol not in info.protocol_values:
+            info.protocol_values[protocol] = None
+
+        timestamp = packet_header[0]
+        microseconds = packet_header[0] * 1000000 + packet_header[1]
+        if info.source_address is None:
+            info.source_address = socket.inet_ntoa(ip_header[8])
+            info.start_time = timestamp
+            info.destination_address = socket.inet_ntoa(ip_header[9])
+            logger.info("Start time: %d", info.start_time)
+
+        flags_fragment_offset = ip_header[4]
+        id = ip_header[3]
+        ttl = ip_header[5]
+        source_address = socket.inet_ntoa(ip_header[8])
+        destination_address = socket.inet_ntoa(ip_header[9])
+
+        i += 1
+        if debug and protocol == 1:
+            logger.debug("%d: Source: %s Destination: %s Timestamp: %d (%d)", i, source_address,
+                         destination_address, timestamp - info.start_time, timestamp)
+        info.packets.append({"packetNum": i, "source": source_address, "dest": destination_address, "protocol": protocol, "ttl": ttl, "id": id, "flags": flags_fragment_offset, "timestamp": timestamp})
+
+        if protocol == 17:
+            info.sent_packets.append({"ttl": ttl, "timestamp": timestamp, "dest": destination_address})
+
+        datagram, datagram_header, sent = packet_data, ip_header, microseconds
+        if flags_fragment_offset & 0x3FFF:
+            # Fragments only go on to probe matching once their datagram is whole, timed by the
+            # first fragment that arrived
+            reassembled = reassembler.fragment(packet_data, ip_header, microseconds)
+            if reassembled is None:
+                datagram = None
+            else:
+                datagram, fragment_count, last_offset, sent = reassembled
+                datagram_header = IPV4_HEADER.unpack_from(datagram)
+                info.fragments[(source_address, destination_address, protocol, id)] = (fragment_count, last_offset)
+
+        if datagram is not None and protocol != 6:
+            # Pair each ICMP reply with the probe it answers; RTTs are kept in milliseconds
+            match = matcher.packet(datagram, datagram_header, sent)
+            if match is not None:
+                router, probe_ttl, rtt = match
+                if router != info.source_address and router != info.destination_address:
+                    info.intermediate_addresses.add(router, probe_ttl)
+                rtt /= 1000
+                info.rtts.append((probe_ttl, router, rtt))
+                if router not in info.rtt_values:
+                    info.rtt_values[router] = []
+                info.rtt_values[router].append(rtt)
+
+        if protocol == 1:
+            parse_ICMP_packet(packet_data, timestamp, info)
+
+    # The first fragmented datagram stands for the original one; the others are in info.fragments
+    for fragment_count, last_offset in info.fragments.values():
+        info.fragment_count = fragment_count
+        info.last_fragment_offset = last_offset
+        break
+
+    logger.info("Packets: %d", i)
+    if stats is not None:
+        stats.count('records_decoded', i)
+        stats.count('icmp_packets', len(info.ICMP_packets))
+        stats.count('udp_packets', len(info.sent_packets))
+        stats.count('probes_matched', matcher.matched)
+        stats.count('probes_expired', matcher.expired)
+        stats.count('fragments_reassembled', reassembler.completed)
+        stats.count('fragments_evicted', reassembler.evicted)
+
+def parse_ICMP_packet(data, timestamp, info):
+    # data starts at the IP header and timestamp comes from the record header
+    ip_header = IPV4_HEADER.unpack_from(data, 0)
+    # Extract source and destination addresses
+    source_address = socket.inet_ntoa(ip_header[8])
+    destination_address = socket.inet_ntoa(ip_header[9])
+    # The ICMP header starts after IHL words of IP header
+    icmp_header_start = (ip_header[0] & 0x0F) * 4
+    # Unpack ICMP header
+    icmp_header = ICMP_HEADER.unpack_from(data, icmp_header_start)
+    # Extract ICMP type and code
+    icmp_type = icmp_header[0]
+    icmp_code = icmp_header[1]
+    # Extract ICMP count
+    count = icmp_header[4]
+    # Create ICMP packet object
+    icmp_packet = ICMP_Packet()
+    icmp_packet.source_address = source_address
+    icmp_packet.destination_address = destination_address
+    icmp_packet.timestamp = timestamp
+    icmp_packet.count = count
+    icmp_packet.type = icmp_type
+
+    info.ICMP_packets.append(icmp_packet)
+    if(icmp_packet.source_address != info.source_address and icmp_packet.source_address != info.destination_address):
+        info.intermediate_addresses.add(icmp_packet.source_address)
+
+def report_fields(filename, stats=None):
+    info = TracerouteInfo()
+    align_data(iter_capture_file(filename, stats=stats), info, stats)
+    return {name: getattr(info, name) for name in REPORT_FIELDS}
+
+def analyze_trace(filename, cache=None, stats=None):
+    # The report fields of a trace, taken from the cache when this version of the parser has
+    # already analyzed the same capture. A cache hit adds nothing to stats but the hit itself
+    analyze = functools.partial(report_fields, stats=stats)
+    if cache is None:
+        fields = analyze(filename)
+    else:
+        hits, misses = cache.hits, cache.misses
+        fields = cache.cached(filename, 'traceroute', ANALYSIS_VERSION, analyze)
+        if stats is not None:
+            stats.count('cache_hits', cache.hits - hits)
+            stats.count('cache_misses', cache.misses - misses)
+    info = TracerouteInfo()
+    for name, value in fields.items():
+        setattr(info, name, value)
+    return info
+
+def fragment_details(info, field):
+    # One value when every fragmented datagram agrees on it, otherwise the value of each one by IP ID
+    values = {key[3]: fragments[field] for key, fragments in info.fragments.items()}
+    if len(set(values.values())) <= 1:
+        return next(iter(values.values()), 0)
+    return ", ".join(f"ID {id}: {value}" for id, value in values.items())
@@ -1,234 +1,17 @@
-import socket
-import struct
 import argparse
-import pandas as pd
-import matplotlib.pyplot as plt
-
-class ICMP_Packet:
-    def __init__(self):
-        self.source_address = None
-        self.destination_address = None
-        self.type = 0
-        self.timestamp = None
-        self.count = 0
-
-class TracerouteInfo:
-    def __init__(self):
-        self.source_address = None
-        self.destination_address = None
-        self.ICMP_packets = []
-        self.intermediate_addresses = []
-        self.start_time = None
-        self.end_time = None
-        self.protocol_values = []
-        self.fragment_count = 0
-        self.last_fragment_offset = 0
-        self.rtt_values = {}
-        self.sd_values = {}
-        self.sent_packets = []
-        self.packets = []
-
-def stdev(data):
-    n = len(data)
-    mean = sum(data) / n
-    return (sum((x - mean) ** 2 for x in data) / n) ** 0.5
-
-def parse_tcp_packet(data):
-    ethernet_header_size = 14  # Ethernet header is 14 bytes
-    ip_header_size = 20  # IP header is typically 20 bytes (without options)
-    
-    # Unpack Ethernet header
-    ethernet_header = struct.unpack('!6s6sH', data[:ethernet_header_size])
-    
-    # Unpack IP header
-    ip_header = struct.unpack('!BBHHHBBH4s4s', data[ethernet_header_size:ethernet_header_size + ip_header_size])
-    
-    # Extract source and destination addresses
-    source_address = socket.inet_ntoa(ip_header[8])
-    destination_address = socket.inet_ntoa(ip_header[9])
-    
-    # Calculate the start of the TCP header
-    tcp_header_start = ethernet_header_size + ip_header_size
-    
-    # Unpack TCP header
-    tcp_header = struct.unpack('!HHLLBBHHH', data[tcp_header_start:tcp_header_start + 20])
-    
-    return source_address, destination_address
-
-def parse_packet_header(data):
-    packet_header_format = 'IIII'
-    packet_header_size = struct.calcsize(packet_header_format)
-    packet_header = struct.unpack(packet_header_format, data[:packet_header_size])
-    return packet_header, data[packet_header_size:]
-
-def read_tracefile(filename):
-    with open(filename, 'rb') as file:
-        data = file.read()
-        print(f"Read {len(data)} bytes from {filename}")
-        #print("Data:", data)
-        return data
-    
-def extract_timestamp(data, offset):
-    # Unpack 8 bytes (seconds and microseconds)
-    try:
-        packet_header = parse_packet_header(data[offset:offset + 16])[0]
-        #print("Packet header:", packet_header)
-        seconds, microseconds = packet_header[0], packet_header[1]
-        # Convert to milliseconds
-        return seconds
-    except struct.error:
-        print(f"Failed to extract timestamp at offset {offset}.")
-        return None
-
-def align_data(data, info):
-    accepted_protocols = [1, 6, 17]
-    start = 0
-    packet_number = 1
-    fragments = {}
-    print("Data length:", len(data))
-
-    i = 0
-    while start < len(data):
-        #print("Packet number:", packet_number)
-        # Skip packets with protocols not in accepted_protocols
-        if start + 20 >= len(data):
-            break
-
-        while start < len(data) and data[start + 9] not in accepted_protocols:
-            start += 1
-            if start + 20 >= len(data):
-                break
-        
-        if start + 20 >= len(data):
-            break
-
-        if info.protocol_values.count(data[start + 9]) == 0:
-            info.protocol_values.append(data[start + 9])
-        
-        ip_header = struct.unpack('!BBHHHBBH4s4s', data[start:start + 20])
-        timestamp = extract_timestamp(data, start - 16)
-
-        # Check if the first 4 bits indicate IPv4
-        version_and_ihl = data[start]
-        ip_version = version_and_ihl >> 4
-        if ip_version != 4:
-            start += 1
-            if start + 20 >= len(data):
-                break  
-            # Not IPv4, skip a byte
-            continue
-        
-        # Check if the packet size is valid
-        #or (info.start_time != None and timestamp < info.start_time)
-        if 5000 < ip_header[2] or ip_header[2] < 20 or ip_header[6] > 255 or ip_header[6] < 0: 
-            start += 1
-            if start + 20 >= len(data):
-                break
-            continue
-
-        if info.source_address is None:
-            info.source_address = socket.inet_ntoa(ip_header[8])
-            info.start_time = extract_timestamp(data, start - 16)
-            info.destination_address = socket.inet_ntoa(ip_header[9])
-            print("Start time:", info.start_time)
-
-        flags_fragment_offset = ip_header[4]
-        id = ip_header[3]
-        ttl = ip_header[5]
-        protocol = ip_header[6]
-        source_address = socket.inet_ntoa(ip_header[8])
-        destination_address = socket.inet_ntoa(ip_header[9])
-
-        i += 1
-        #print(data[start:start + 20])
-        if protocol == 1:
-            print(i, ": Source:", source_address)
-            print(i, ": Destination:", destination_address)
-            #print(i, ": Protocol:", protocol)
-            #print(i, ": TTL:", ttl)
-            #print(i, ": ID:", id)
-            #print(i, ": Flags:", flags_fragment_offset)
-            print(i, ": Timestamp:", timestamp - info.start_time)
-        info.packets.append({"packetNum": i, "source": source_address, "dest": destination_address, "protocol": protocol, "ttl": ttl, "id": id, "flags": flags_fragment_offset, "timestamp": timestamp})
-        '''
-        if (source_address != info.source_address and source_address != info.destination_address) and source_address not in info.intermediate_addresses:
-            info.intermediate_addresses.append(source_address)
-
-        if (destination_address != info.source_address and destination_address != info.destination_address) and destination_address not in info.intermediate_addresses:
-            info.intermediate_addresses.append(destination_address)
-        '''
-
-        if protocol == 17:
-            info.sent_packets.append({"ttl": ttl, "timestamp": timestamp, "dest": destination_address})
-
-        mf_flag = (flags_fragment_offset & 0x2000) >> 13
-        fragment_offset = flags_fragment_offset & 0x1FFF
-
-        if id not in fragments:
-            fragments[id] = {"count": 0, "last_offset": 0}
-
-        fragments[id]["count"] += 1
-        fragments[id]["last_offset"] = max(fragments[id]["last_offset"], fragment_offset)
-        
-        #print("Packet size:", ip_header[2])
-        #print("Source:", socket.inet_ntoa(ip_header[8]))
-        #print("Destination:", socket.inet_ntoa(ip_header[9]))
-        if(ip_header[6] == 1):
-            #print("Protocol: ICMP")
-            parse_ICMP_packet(data[start - 16:], info)
-
-        
-        start += 50  # Move to the next packet based on the IP header's total length
-        if start + 20 >= len(data):
-            break
-        packet_number += 1
-
-    for id, fragment_data in fragments.items():
-        info.fragment_count += fragment_data["count"]
-        info.last_fragment_offset = max(info.last_fragment_offset, fragment_data["last_offset"] * 8)
-
-    print(f"Final offset: {start}, File length: {len(data)}")
-
-def parse_ICMP_packet(data, info):
-    # Unpack IP header
-    ip_header = struct.unpack('!BBHHHBBH4s4s', data[16:36])
-    # Extract source and destination addresses
-    source_address = socket.inet_ntoa(ip_header[8])
-    destination_address = socket.inet_ntoa(ip_header[9])
-    # Calculate the start of the ICMP header
-    icmp_header_start = 20
-    # Unpack ICMP header
-    icmp_header = struct.unpack('!BBHHH', data[icmp_header_start:icmp_header_start + 8])
-    # Extract ICMP type and code
-    icmp_type = icmp_header[0]
-    icmp_code = icmp_header[1]
-    # Extract ICMP timestamp
-    timestamp = extract_timestamp(data, 0)
-    print("Timestamp:", timestamp)
-    # Extract ICMP count
-    count = struct.unpack('!H', data[icmp_header_start + 16:icmp_header_start + 18])[0]
-    # Create ICMP packet object
-    icmp_packet = ICMP_Packet()
-    icmp_packet.source_address = source_address
-    icmp_packet.destination_address = destination_address
-    icmp_packet.timestamp = timestamp
-    icmp_packet.count = count
-    icmp_packet.type = icmp_type
-
-
-    info.ICMP_packets.append(icmp_packet)
-    if(icmp_packet.source_address not in info.intermediate_addresses and icmp_packet.source_address != info.source_address and icmp_packet.source_address != info.destination_address): 
-        info.intermediate_addresses.append(icmp_packet.source_address)
-        
-    rtt = info.start_time - timestamp
-    print(f"RTT = {info.start_time} - {timestamp} = {rtt:.2f}")
-    print(f"RTT: {rtt:.2f}")
-    #print("ICMP Packet:" + icmp_packet.source_address)
-    rtt = timestamp - info.start_time
-    print("----------------------", source_address)
-    if source_address not in info.rtt_values:
-        info.rtt_values[source_address] = []
-    info.rtt_values[source_address].append(rtt)
+import csv
+import functools
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from pcaptools.cache import AnalysisCache
+from pcaptools.instrument import Collector
+from pcaptools.stats import QuantileSketch, RunningStats, stdev
+from pcaptools.traceroute import analyze_trace, fragment_details
 
 def print_info(info):
 
@@ -276,18 +59,18 @@ def print_info(info):
     print("-" * 90)
     print(f"{'3':<5} {'The IP addresses of the intermediate destination nodes (R1)':<60} {', '.join(info.intermediate_addresses)}")
     print("-" * 90)
-    print(f"{'4':<5} {'The correct order of the intermediate destination nodes (R1)':<60} {', '.join(info.intermediate_addresses)}")
+    print(f"{'4':<5} {'The correct order of the intermediate destination nodes (R1)':<60} {', '.join(info.intermediate_addresses.route())}")
     print("-" * 90)
 
     # Protocol values
-    protocol_details = ", ".join(f"{p}: {'ICMP' if p == 1 else 'UDP' if p == 17 else 'Unknown'}" for p in info.protocol_values)
+    protocol_details = ", ".join(f"{p}: {'ICMP' if p == 1 else 'UDP' if p == 17 else 'Unknown'}" for p in sorted(info.protocol_values))
     print(f"{'5':<5} {'The values in the protocol field of IP headers (R1)':<60} {protocol_details}")
     print("-" * 90)
 
     # Fragmentation details for single datagram
-    print(f"{'6':<5} {'The number of fragments created from the original datagram (R1)':<60} {info.fragment_count}")
+    print(f"{'6':<5} {'The number of fragments created from the original datagram (R1)':<60} {fragment_details(info, 0)}")
     print("-" * 90)
-    print(f"{'7':<5} {'The offset of the last fragment (R1)':<60} {info.last_fragment_offset}")
+    print(f"{'7':<5} {'The offset of the last fragment (R1)':<60} {fragment_details(info, 1)}")
     print("-" * 90)
 
     # RTT details
@@ -316,38 +99,177 @@ def print_info(info):
     print(f"{'12':<5} {'Right answer to the third/or fourth question (R2)':<60} {answer_third_question}")
     print("=" * 90)
 
-def generate_ttl_rtt_table(filenames):
+def summarize_trace(filename, cache=None, collect=False):
+    # Worker side of generate_ttl_rtt_table: analyze one trace and return only a running summary
+    # and a quantile sketch of its matched probe RTTs per probe TTL, which take the same space
+    # however many probes the trace has. With collect, the worker's Collector is returned too
+    collector = Collector() if collect else None
+    if collector is None:
+        info = analyze_trace(filename, cache)
+    else:
+        with collector.stage('analyze'):
+            info = analyze_trace(filename, cache, collector)
+    ttl_rtt = {}
+    for ttl, router, rtt in info.rtts:
+        if ttl not in ttl_rtt:
+            ttl_rtt[ttl] = (RunningStats(), QuantileSketch())
+        stats, sketch = ttl_rtt[ttl]
+        stats.add(rtt)
+        sketch.add(rtt)
+    return ttl_rtt if collector is None else (ttl_rtt, collector)
+
+def summarize_traces(filenames, workers, cache=None, stats=None):
+    # Yield the summary of every trace in order, from a pool of processes when there are several.
+    # The workers' counters and timings are merged into stats as their summaries come back
+    summarize = functools.partial(summarize_trace, cache=cache, collect=stats is not None)
+    if workers > 1 and len(filenames) > 1:
+        workers = min(workers, len(filenames))
+        # Hand out traces a few at a time so many small ones do not cost a round trip each
+        chunk_size = max(1, len(filenames) // (workers * 4))
+        with multiprocessing.Pool(workers) as pool:
+            summaries = pool.imap(summarize, filenames, chunk_size)
+            yield from summaries if stats is None else merged(summaries, stats)
+    else:
+        summaries = map(summarize, filenames)
+        yield from summaries if stats is None else merged(summaries, stats)
+
+def merged(results, stats):
+    for summaries, worker_stats in results:
+        stats.merge(worker_stats)
+        yield summaries
+
+def generate_ttl_rtt_table(filenames, workers=1, cache=None, stats=None):
+    # The RTT summary of every probe TTL in every trace, as a list of (TTL, summaries) rows sorted
+    # by TTL, with None where a trace has no matched probe at that TTL
     ttl_rtt = {}
-    for filename in filenames:
-        traceroute_data = read_tracefile(filename)
-        info = TracerouteInfo()
-        align_data(traceroute_data, info)
-        
-        for packet in info.packets:
-            ttl = packet["ttl"]
-            rtt = packet["timestamp"]
+    for filename, summaries in zip(filenames, summarize_traces(filenames, workers, cache, stats)):
+        for ttl, summary in summaries.items():
             if ttl not in ttl_rtt:
                 ttl_rtt[ttl] = {}
-            if filename not in ttl_rtt[ttl]:
-                ttl_rtt[ttl][filename] = []
-            ttl_rtt[ttl][filename].append(rtt)
-    
-    ttl_avg_rtt = {ttl: {filename: sum(rtts) / len(rtts) for filename, rtts in files.items()} for ttl, files in ttl_rtt.items()}
-    df = pd.DataFrame(ttl_avg_rtt).T.fillna(0)
-    df.columns = [f"Average RTT ({filename})" for filename in filenames]
-    df = df.sort_index(ascending=True)
-    
+            ttl_rtt[ttl][filename] = summary
+    return [(ttl, [ttl_rtt[ttl].get(filename) for filename in filenames]) for ttl in sorted(ttl_rtt)]
+
+# (column label, JSON key) of every statistic reported for a trace at one TTL. The s.d. is the
+# population standard deviation, as in P3_Fall2024, and the percentiles are nearest-rank ones
+STATISTICS = (("Average RTT", "mean"), ("RTT s.d.", "stdev"), ("Min RTT", "min"), ("Median RTT", "p50"),
+              ("95th percentile RTT", "p95"), ("Max RTT", "max"))
+
+def rtt_statistics(summary):
+    # The STATISTICS of one (TTL, trace) summary, all None when the trace had no RTT at that TTL
+    if summary is None:
+        return [None] * len(STATISTICS)
+    stats, sketch = summary
+    return [stats.mean, stats.variance ** 0.5, stats.minimum, sketch.quantile(0.5), sketch.quantile(0.95),
+            stats.maximum]
+
+def column_labels(filenames):
+    return [f"{label} ({filename})" for filename in filenames for label, _ in STATISTICS]
+
+def format_rtt(rtt):
+    return '' if rtt is None else f"{rtt:.2f}"
+
+def table_cells(summaries):
+    return [format_rtt(value) for summary in summaries for value in rtt_statistics(summary)]
+
+def write_csv(filenames, rows, out):
+    writer = csv.writer(out)
+    writer.writerow(['TTL'] + column_labels(filenames))
+    for ttl, summaries in rows:
+        writer.writerow([ttl] + table_cells(summaries))
+
+def write_json(filenames, rows, out):
+    table = []
+    for ttl, summaries in rows:
+        traces = {}
+        for filename, summary in zip(filenames, summaries):
+            if summary is not None:
+                traces[filename] = dict(count=summary[0].count,
+                                        **{key: value for (_, key), value in zip(STATISTICS, rtt_statistics(summary))})
+        table.append({"ttl": ttl, "traces": traces})
+    json.dump(table, out, indent=2)
+    out.write('\n')
+
+def write_markdown(filenames, rows, out):
+    labels = column_labels(filenames)
+    out.write('| TTL | ' + ' | '.join(labels) + ' |\n')
+    out.write('|---:|' + '---:|' * len(labels) + '\n')
+    for ttl, summaries in rows:
+        out.write(f'| {ttl} | ' + ' | '.join(table_cells(summaries)) + ' |\n')
+
+def write_png(filenames, rows, path):
+    # matplotlib is only imported for this format, with a backend that needs no display
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
     fig, ax = plt.subplots(figsize=(12, 8))
     ax.axis('tight')
     ax.axis('off')
-    table = ax.table(cellText=df.values, colLabels=df.columns, rowLabels=df.index, cellLoc='center', loc='center')
+    # The image keeps to one column per trace: the average RTT and its standard deviation
+    cells = []
+    for _, summaries in rows:
+        cells.append([])
+        for summary in summaries:
+            mean, stdev = rtt_statistics(summary)[:2]
+            cells[-1].append('' if mean is None else f"{mean:.2f} ± {stdev:.2f}")
+    table = ax.table(cellText=cells, colLabels=[f"Average RTT ({filename})" for filename in filenames],
+                     rowLabels=[ttl for ttl, _ in rows], cellLoc='center', loc='center')
     table.auto_set_font_size(False)
     table.set_fontsize(10)
     table.scale(1.2, 1.2)
     plt.title("Average RTT by TTL and Filename")
-    plt.savefig("average_rtt_table.png")
-    plt.show()
+    plt.savefig(path)
+    plt.close(fig)
+
+TEXT_WRITERS = {'csv': write_csv, 'json': write_json, 'markdown': write_markdown}
+DEFAULT_OUTPUTS = {'csv': 'average_rtt_table.csv', 'json': 'average_rtt_table.json',
+                   'markdown': 'average_rtt_table.md', 'png': 'average_rtt_table.png'}
 
 if __name__ == '__main__':
-    filenames = ["group1-trace1.pcap", "group1-trace2.pcap", "group1-trace3.pcap", "group1-trace4.pcap", "group1-trace5.pcap"]
-    generate_ttl_rtt_table(filenames)
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('filenames', nargs='+', help='The traceroute captures to tabulate, one column each')
+    parser.add_argument('--format', choices=['png', 'csv', 'json', 'markdown'], default='png',
+                        help='Output format; only png needs matplotlib')
+    parser.add_argument('--output', help="Where to write the table, '-' for standard output "
+                                         "(default: average_rtt_table with the format's extension)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of processes that analyze separate traces (default: one per core)')
+    parser.add_argument('--cache-dir', help='Directory of the analysis cache (default: ~/.cache/csc361)')
+    parser.add_argument('--no-cache', action='store_true', help='Parse every trace even if it was analyzed before')
+    parser.add_argument('--stats', action='store_true',
+                        help='Write stage timings and packet counters as JSON to standard error')
+    parser.add_argument('--stats-file', metavar='FILE', help='Write the --stats JSON to FILE instead')
+    parser.add_argument('--log-level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='WARNING',
+                        help='Log to standard error from this level up; DEBUG logs every ICMP packet')
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.format == 'png' and args.output == '-':
+        parser.error('png output needs a file name')
+    logging.basicConfig(stream=sys.stderr, level=args.log_level, format='%(levelname)s %(message)s')
+
+    stats = Collector() if args.stats or args.stats_file else None
+    cache = None if args.no_cache else AnalysisCache(args.cache_dir)
+    # Worker stages add up across processes; 'table' is the wall time of the whole analysis
+    start = time.perf_counter()
+    rows = generate_ttl_rtt_table(args.filenames, args.workers, cache, stats)
+    if stats is not None:
+        stats.add_time('table', time.perf_counter() - start)
+        start = time.perf_counter()
+
+    output = args.output or DEFAULT_OUTPUTS[args.format]
+    if args.format == 'png':
+        write_png(args.filenames, rows, output)
+    elif output == '-':
+        TEXT_WRITERS[args.format](args.filenames, rows, sys.stdout)
+    else:
+        with open(output, 'w', newline='') as out:
+            TEXT_WRITERS[args.format](args.filenames, rows, out)
+
+    if stats is not None:
+        stats.add_time('write', time.perf_counter() - start)
+        if args.stats_file:
+            with open(args.stats_file, 'w') as out:
+                stats.dump(out)
+        else:
+            stats.dump(sys.stderr)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The analyzers import pcaptools and their assignment's own modules from their own directories
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, os.path.join(ROOT, 'ass2'))
+sys.path.insert(0, ROOT)
@@ -0,0 +1,86 @@
+import struct
+
+from pcaptools.decode import IPV4_HEADER
+from pcaptools.fragments import MORE_FRAGMENTS, Reassembler
+
+SOURCE = bytes([10, 0, 0, 1])
+DESTINATION = bytes([10, 0, 0, 2])
+
+def fragment(identification, offset, payload, more):
+    # An IPv4 fragment carrying payload at byte offset, and its unpacked header
+    flags = offset // 8 | (MORE_FRAGMENTS if more else 0)
+    header = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), identification, flags, 64, 17, 0,
+                         SOURCE, DESTINATION)
+    packet = header + payload
+    return packet, IPV4_HEADER.unpack_from(packet)
+
+PAYLOAD = bytes(range(48))
+
+def pieces(identification=1):
+    return [fragment(identification, 0, PAYLOAD[:16], True), fragment(identification, 16, PAYLOAD[16:32], True),
+            fragment(identification, 32, PAYLOAD[32:], False)]
+
+def test_fragments_in_order():
+    reassembler = Reassembler()
+    first, middle, last = pieces()
+    assert reassembler.fragment(*first, 0) is None
+    assert reassembler.fragment(*middle, 1) is None
+    datagram, count, last_offset, timestamp = reassembler.fragment(*last, 2)
+    header = IPV4_HEADER.unpack_from(datagram)
+    assert datagram[20:] == PAYLOAD
+    assert header[2] == 20 + len(PAYLOAD)
+    assert header[4] == 0
+    assert (count, last_offset, timestamp) == (3, 32, 0)
+    assert reassembler.held == 0 and not reassembler.partial
+
+def test_fragments_out_of_order():
+    reassembler = Reassembler()
+    first, middle, last = pieces()
+    assert reassembler.fragment(*last, 0) is None
+    assert reassembler.fragment(*first, 1) is None
+    datagram, count, last_offset, timestamp = reassembler.fragment(*middle, 2)
+    assert datagram[20:] == PAYLOAD
+    # Timed by the fragment that arrived first
+    assert (count, last_offset, timestamp) == (3, 32, 0)
+
+def test_overlapping_and_duplicate_fragments():
+    reassembler = Reassembler()
+    assert reassembler.fragment(*fragment(1, 0, PAYLOAD[:24], True), 0) is None
+    assert reassembler.fragment(*fragment(1, 8, PAYLOAD[8:24], True), 1) is None
+    assert reassembler.fragment(*fragment(1, 16, PAYLOAD[16:40], True), 2) is None
+    assert reassembler.fragment(*fragment(1, 16, PAYLOAD[16:40], True), 3) is None
+    datagram, count, last_offset, _ = reassembler.fragment(*fragment(1, 32, PAYLOAD[32:], False), 4)
+    assert datagram[20:] == PAYLOAD
+    assert (count, last_offset) == (5, 32)
+    assert reassembler.held == 0
+
+def test_datagrams_are_kept_apart_by_identification():
+    reassembler = Reassembler()
+    a, b = pieces(1), pieces(2)
+    for piece in a[:2] + b[:2]:
+        assert reassembler.fragment(*piece, 0) is None
+    assert reassembler.fragment(*b[2], 1)[0][20:] == PAYLOAD
+    assert reassembler.fragment(*a[2], 2)[0][20:] == PAYLOAD
+
+def test_memory_budget_drops_the_oldest_datagram():
+    reassembler = Reassembler(memory_budget=40)
+    a, b = pieces(1), pieces(2)
+    assert reassembler.fragment(*a[0], 0) is None
+    assert reassembler.fragment(*b[0], 1) is None
+    assert reassembler.fragment(*b[1], 2) is None
+    assert reassembler.evicted == 1
+    assert reassembler.held == 32
+    assert reassembler.fragment(*b[2], 3)[0][20:] == PAYLOAD
+    # Without its first fragment the dropped datagram can no longer complete
+    assert reassembler.fragment(*a[1], 4) is None
+    assert reassembler.fragment(*a[2], 5) is None
+
+def test_timeout_drops_stale_datagrams():
+    reassembler = Reassembler(timeout=1000)
+    a, b = pieces(1), pieces(2)
+    assert reassembler.fragment(*a[0], 0) is None
+    assert reassembler.fragment(*a[1], 500) is None
+    assert reassembler.fragment(*b[0], 1001) is None
+    assert reassembler.evicted == 1
+    assert reassembler.fragment(*a[2], 1002) is None
+    assert list(reassembler.partial) == [(SOURCE, DESTINATION, 17, 2), (SOURCE, DESTINATION, 17, 1)]
@@ -0,0 +1,47 @@
+import io
+import os
+
+import pytest
+
+import p2
+from pcaptools.reader import iter_capture_file, iter_capture_records, map_capture_file
+
+SAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'ass2', 'sample-capture-file.cap')
+
+def report(flows):
+    out = io.StringIO()
+    p2.print_results(flows, out=out)
+    return out.getvalue()
+
+@pytest.fixture(params=[5000, 5010, 20000])
+def truncated_capture(request, tmp_path):
+    # The sample capture cut inside a record (5000 and 20000) and inside a record header (5010)
+    with open(SAMPLE, 'rb') as file:
+        data = file.read(request.param)
+    path = tmp_path / 'truncated.cap'
+    path.write_bytes(data)
+    return str(path)
+
+def test_readers_drop_truncated_record(truncated_capture):
+    streamed = [(header, bytes(packet)) for header, packet in iter_capture_file(truncated_capture, chunk_size=4096)]
+    walked = [(header, bytes(packet)) for header, packet in iter_capture_records(map_capture_file(truncated_capture))]
+    assert walked == streamed
+    assert len(p2.index_record_offsets(map_capture_file(truncated_capture))) >= len(walked)
+
+def test_engines_agree_on_truncated_capture(truncated_capture):
+    columnar = pytest.importorskip('columnar')
+    serial = report(p2.parse_capture_data(iter_capture_file(truncated_capture)))
+    assert report(columnar.parse_capture_columns(map_capture_file(truncated_capture))) == serial
+    assert report(p2.parse_capture_parallel(truncated_capture, 3)) == serial
+
+def test_parallel_falls_back_on_bad_resync(monkeypatch):
+    serial = report(p2.parse_capture_data(iter_capture_file(SAMPLE)))
+    size = os.path.getsize(SAMPLE)
+    # Cut one byte past every resynced boundary, inside a record header
+    split = p2.split_record_ranges
+    def bad_split(data, parts):
+        ranges = split(data, parts)
+        cuts = [ranges[0][0]] + [stop + 1 for _, stop in ranges[:-1]] + [size]
+        return list(zip(cuts, cuts[1:]))
+    monkeypatch.setattr(p2, 'split_record_ranges', bad_split)
+    assert report(p2.parse_capture_parallel(SAMPLE, 4)) == serial
@@ -0,0 +1,69 @@
+from rtt import ACK, MAX_OUTSTANDING, SEQUENCE_MASK, SYN, RttTracker, SegmentIndex
+
+def test_ack_times_the_last_segment_it_covers():
+    index = SegmentIndex(1000)
+    index.send(1000, 100, 0)
+    index.send(1100, 100, 10)
+    assert index.ack(1200, 50) == 40
+    assert index.idle()
+
+def test_ack_inside_a_segment_gives_no_sample():
+    index = SegmentIndex(1000)
+    index.send(1000, 100, 0)
+    assert index.ack(1050, 20) is None
+    assert index.ack(1100, 30) == 30
+
+def test_ack_past_anything_sent_is_ignored():
+    index = SegmentIndex(1000)
+    index.send(1000, 100, 0)
+    assert index.ack(1300, 20) is None
+    assert index.ack(1100, 30) == 30
+
+def test_karn_rule_skips_retransmitted_segment():
+    index = SegmentIndex(1000)
+    index.send(1000, 100, 0)
+    index.send(1000, 100, 200)
+    assert index.ack(1100, 250) is None
+
+def test_partial_retransmit_marks_only_the_segments_it_overlaps():
+    index = SegmentIndex(1000)
+    index.send(1000, 100, 0)
+    index.send(1100, 100, 5)
+    index.send(1050, 50, 20)
+    assert index.ack(1100, 30) is None
+    assert index.ack(1200, 40) == 35
+
+def test_retransmit_across_a_boundary_marks_both_segments():
+    index = SegmentIndex(1000)
+    index.send(1000, 100, 0)
+    index.send(1100, 100, 5)
+    index.send(1080, 40, 20)
+    assert index.ack(1200, 40) is None
+
+def test_sequence_numbers_wrap_around():
+    isn = SEQUENCE_MASK - 15
+    index = SegmentIndex(isn)
+    index.send(isn, 100, 0)
+    index.send((isn + 100) & SEQUENCE_MASK, 50, 10)
+    assert index.ack((isn + 100) & SEQUENCE_MASK, 7) == 7
+    assert index.ack((isn + 150) & SEQUENCE_MASK, 25) == 15
+
+def test_outstanding_segments_are_capped():
+    index = SegmentIndex(0)
+    for i in range(MAX_OUTSTANDING + 1):
+        index.send(i, 1, i)
+    assert len(index.ends) - index.head == MAX_OUTSTANDING
+    # The oldest segment was dropped, so an ACK for it alone gives nothing
+    assert index.ack(1, 10000) is None
+    assert index.ack(2, 10000) == 10000 - 1
+
+def test_handshake_is_timed_like_data():
+    tracker = RttTracker()
+    assert tracker.segment(1, 0, 0, 100, 0, 1, SYN) is None
+    assert tracker.segment(1, 1, 30, 500, 101, 1, SYN | ACK) == 30
+
+def test_retransmitted_syn_gives_no_sample():
+    tracker = RttTracker()
+    tracker.segment(1, 0, 0, 100, 0, 1, SYN)
+    tracker.segment(1, 0, 3000, 100, 0, 1, SYN)
+    assert tracker.segment(1, 1, 3030, 500, 101, 1, SYN | ACK) is None
@@ -0,0 +1,19 @@
+import pytest
+
+from pcaptools.stats import QuantileSketch, RunningStats, stdev
+
+def test_quantiles_use_nearest_rank():
+    sketch = QuantileSketch()
+    for value in (10.0, 20.0, 30.0):
+        sketch.add(value)
+    assert sketch.quantile(0.5) == pytest.approx(20.0, rel=0.01)
+    # With three probes the 95th percentile is the slowest one, not the median
+    assert sketch.quantile(0.95) == pytest.approx(30.0, rel=0.01)
+    assert sketch.quantile(0.0) == pytest.approx(10.0, rel=0.01)
+
+def test_running_stats_match_stdev():
+    values = [11.2, 11.5, 11.4, 30.0]
+    stats = RunningStats()
+    for value in values:
+        stats.add(value)
+    assert stats.variance ** 0.5 == pytest.approx(stdev(values))